@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# Internal Imports
+import logging
+
+# Advisory lock held by every transaction which writes to the change log.  Sequence numbers are only handed out under
+# the lock, so they become visible in the order they were issued, and a reader which has seen a sequence number has
+# seen everything before it.  Writers take it last, just before they commit, so it is never held while waiting on a
+# row lock.
+CHANGELOG_LOCK = 7242
+
+
+def changelog_floor(db_link):
+    """
+    Return the change log floor.  Removals at or below the floor may have been compacted away, so changes since a
+    sequence number below it are incomplete.
+
+    :param db_link:
+    :return: Floor sequence number, or 0 if no removals have been compacted away.
+    """
+    db = db_link.cursor()
+
+    db.execute("SELECT COALESCE(MAX(seq), 0) FROM changelogfloor")
+    floor = db.fetchone()[0]
+
+    db.close()
+
+    return floor
+
+
+def changelog_last(db_link):
+    """
+    Return the last sequence number in the change log.
+
+    :param db_link:
+    :return: Last sequence number, or 0 if the change log is empty.
+    """
+    db = db_link.cursor()
+
+    db.execute("SELECT COALESCE(MAX(seq), 0) FROM changelog")
+    last = db.fetchone()[0]
+
+    db.close()
+
+    return last
+
+
+def changelog_since(db_link, since=0):
+    """
+    Return the net changes to the block list after a given sequence number.
+
+    Only the last change to each address and source is returned, so an address which was added and then removed again
+    is reported once, as a removal.  Changes since a sequence number below the change log floor may be missing
+    removals, so none are returned, and the caller should start again from 0 with an empty block list.
+
+    :param db_link:
+    :param since: Last sequence number already applied, or 0 for everything.
+    :return: Tuple of the last sequence number, a list of (address, source, score) tuples added or updated, and a list of
+             (address, source) tuples removed.  Both lists are None if the caller has to start again from 0.
+    """
+    log = logging.getLogger("changelog/changelog_since")
+
+    db = db_link.cursor()
+
+    db.execute("SELECT COALESCE(MAX(seq), 0) FROM changelog")
+    last = db.fetchone()[0]
+
+    sql = "SELECT DISTINCT ON (address, source) address, source, action, score FROM changelog " \
+          "WHERE seq > %s AND seq <= %s ORDER BY address, source, seq DESC"
+    db.execute(sql, (since, last))
+
+    added = []
+    removed = []
+
+    for address, source, action, score in db:
+        if action == "DELETE":
+            removed.append((address, source))
+        else:
+            added.append((address, source, score))
+
+    db.close()
+
+    # The floor is read last, so a compaction which ran during the query is caught.
+    floor = changelog_floor(db_link)
+
+    if 0 < since < floor:
+        log.debug("Sequence {} is below the change log floor of {}.".format(since, floor))
+        return last, None, None
+
+    log.debug("Changes {}-{}: {} added or updated, {} removed.".format(since, last, len(added), len(removed)))
+
+    return last, added, removed
+
+
+def changelog_compact(db_link, through=None, removals=False):
+    """
+    Compact the change log up to a given sequence number, keeping only the last change to each address and source.
+
+    Changes since any sequence number are the same before and after compaction, so consumers need not keep up with it.
+    Removals are kept unless asked otherwise, as they are the last change to their address.  Dropping them as well
+    raises the change log floor to the sequence number compacted through, and should only be done once every consumer
+    has read past it.  A consumer starting from 0 is unaffected, as it has nothing to remove.
+
+    :param db_link:
+    :param through: Last sequence number to compact, or None for the whole log.
+    :param removals: Also drop the removals up to the sequence number.
+    :return: Tuple of the number of changes removed, and the sequence number compacted through.
+    """
+    log = logging.getLogger("changelog/changelog_compact")
+
+    autocommit = db_link.autocommit
+    db_link.autocommit = False
+
+    db = db_link.cursor()
+
+    try:
+        if through is None:
+            db.execute("SELECT COALESCE(MAX(seq), 0) FROM changelog")
+            through = db.fetchone()[0]
+
+        sql = "DELETE FROM changelog c WHERE c.seq <= %s AND EXISTS (SELECT 1 FROM changelog n " \
+              "WHERE n.address = c.address AND n.source = c.source AND n.seq > c.seq)"
+        db.execute(sql, (through,))
+        removed = db.rowcount
+
+        # The floor moves in the same transaction, so no reader sees the removals gone without it.
+        if removals:
+            db.execute("DELETE FROM changelog WHERE seq <= %s AND action = 'DELETE'", (through,))
+            removed += db.rowcount
+
+            db.execute("UPDATE changelogfloor SET seq = GREATEST(seq, %s), updated = current_timestamp", (through,))
+            if db.rowcount == 0:
+                db.execute("INSERT INTO changelogfloor (seq) VALUES (%s)", (through,))
+
+        db_link.commit()
+    except Exception:
+        db_link.rollback()
+        raise
+    finally:
+        db.close()
+        db_link.autocommit = autocommit
+
+    log.debug("Compacted the change log through {}: {} changes removed.".format(through, removed))
+
+    return removed, through
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+
+from prefixset import PrefixSet, prefix_to_int
+
+# Internal Imports
+import bisect
+import logging
+
+
+def read_prefix_file(file_name):
+    """
+    Read a list of prefixes from a file, one per line.  Blank lines and anything following a '#' are ignored.
+
+    :param file_name:
+    :return: List of prefix strings.
+    """
+    log = logging.getLogger("exclusions/read_prefix_file")
+
+    prefixes = []
+
+    try:
+        with open(file_name, "r") as file:
+            for line in file:
+                line = line.split('#', 1)[0].strip()
+                if line:
+                    prefixes.append(line)
+        log.debug("Loaded {} prefixes from {}.".format(len(prefixes), file_name))
+    except OSError as error:
+        log.error("Unable to read exclusion file {}: {}".format(file_name, error))
+
+    return prefixes
+
+
+class ExclusionMatcher:
+    """
+    Exact and subnet exclusions compiled into integer lookup tables.
+
+    Exact exclusions are held in a set keyed by (version, network, prefix length).  Subnet exclusions are reduced to
+    their widest non-overlapping blocks and kept as sorted interval tables per address family, so each lookup is a
+    single bisect no matter how many exclusions are configured.  An address covered by nested subnet exclusions is
+    counted against the widest rule covering it.
+    """
+
+    def __init__(self, exact=None, within=None):
+        """
+        :param exact: Iterable of prefixes which are excluded only when matched exactly.
+        :param within: Iterable of prefixes which exclude anything inside of them.
+        """
+        log = logging.getLogger("exclusions/ExclusionMatcher")
+
+        self.exact = {}
+        self.starts = {4: [], 6: []}
+        self.ends = {4: [], 6: []}
+        self.rules = {4: [], 6: []}
+
+        for rule in exact or []:
+            key = prefix_to_int(str(rule))
+            if key is None:
+                log.error("Invalid exact exclusion: {}".format(rule))
+                continue
+            self.exact[key] = str(rule)
+
+        # Build the intervals, widest first for any given starting address.
+        intervals = {4: [], 6: []}
+        for rule in within or []:
+            key = prefix_to_int(str(rule))
+            if key is None:
+                log.error("Invalid within exclusion: {}".format(rule))
+                continue
+            version, network, bits = key
+            width = 32 if version == 4 else 128
+            intervals[version].append((network, network | ((1 << (width - bits)) - 1), str(rule)))
+
+        # CIDR blocks are either nested or disjoint, so anything starting inside the previous block is covered by it.
+        for version in intervals:
+            for start, end, rule in sorted(intervals[version], key=lambda interval: (interval[0], -interval[1])):
+                if self.ends[version] and start <= self.ends[version][-1]:
+                    continue
+                self.starts[version].append(start)
+                self.ends[version].append(end)
+                self.rules[version].append(rule)
+
+        log.debug("Compiled {} exact and {} subnet exclusions.".format(len(self.exact),
+                                                                      len(self.rules[4]) + len(self.rules[6])))
+
+    @classmethod
+    def from_config(cls, exclude):
+        """
+        Build a matcher from the listrunner exclude section, including any external exclusion files.
+
+        :param exclude: The config['listrunner']['exclude'] dictionary.
+        :return:
+        """
+        exact = []
+        within = []
+
+        if exclude:
+            exact.extend(exclude.get('exact') or [])
+            within.extend(exclude.get('within') or [])
+
+            for key, target in (('exact_files', exact), ('within_files', within)):
+                file_list = exclude.get(key) or []
+                if isinstance(file_list, str):
+                    file_list = [file_list]
+                for file_name in file_list:
+                    target.extend(read_prefix_file(file_name))
+
+        return cls(exact, within)
+
+    def __len__(self):
+        return len(self.exact) + len(self.rules[4]) + len(self.rules[6])
+
+    def match(self, prefix):
+        """
+        Return the exclusion rule which matches a given prefix.
+
+        :param prefix: CIDR string.
+        :return: The matching rule, or None if the prefix is not excluded.
+        """
+        key = prefix_to_int(prefix)
+        if key is None:
+            return None
+
+        return self.match_int(*key)
+
+    def match_int(self, version, network, bits):
+        """
+        Return the exclusion rule which matches an already converted prefix.
+
+        :param version:
+        :param network:
+        :param bits:
+        :return: The matching rule, or None if the prefix is not excluded.
+        """
+        rule = self.exact.get((version, network, bits))
+        if rule is not None:
+            return rule
+
+        starts = self.starts[version]
+        if not starts:
+            return None
+
+        i = bisect.bisect_right(starts, network) - 1
+        if i >= 0:
+            width = 32 if version == 4 else 128
+            if network | ((1 << (width - bits)) - 1) <= self.ends[version][i]:
+                return self.rules[version][i]
+
+        return None
+
+    def filter(self, prefixes):
+        """
+        Filter a whole list of prefixes against the exclusions.
+
+        :param prefixes: PrefixSet, or an iterable of CIDR strings.
+        :return: Tuple of the kept prefixes, and a dictionary of exclusion counts keyed by rule.
+        """
+        counts = {}
+
+        # A prefix set is filtered on its integers, and the kept entries come back as a set with their values.
+        if isinstance(prefixes, PrefixSet):
+            if not len(self):
+                return prefixes, counts
+
+            selectors = []
+            for network, bits in prefixes.networks():
+                rule = self.match_int(4, network, bits)
+                if rule is not None:
+                    counts[rule] = counts.get(rule, 0) + 1
+                selectors.append(rule is None)
+
+            return prefixes.select(selectors), counts
+
+        kept = []
+
+        # Nothing to do without any exclusions.
+        if not len(self):
+            return list(prefixes), counts
+
+        for prefix in prefixes:
+            rule = self.match(prefix)
+            if rule is None:
+                kept.append(prefix)
+            else:
+                counts[rule] = counts.get(rule, 0) + 1
+
+        return kept, counts
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+# Internal Imports
+import logging
+import random
+import threading
+import time
+
+
+class BatchController:
+    """
+    Batch sizing and pacing for pushes to a router, in the manner of TCP congestion control.
+
+    Each batch which completes inside the target latency grows the next one by a fixed step.  A slow batch, or one
+    which fails, shrinks it by a fraction.  A slow batch is also followed by a pause as long as it overran the target,
+    so the router's control plane can catch up, rather than a fixed sleep after every batch.  Failed batches are
+    retried after a capped exponential backoff until the retry budget for the push runs out.
+    """
+
+    def __init__(self, size=300, minimum=10, maximum=5000, target=5.0, step=50, factor=0.5, retries=20,
+                 backoff=1.0, backoff_max=60.0):
+        """
+        :param size: Starting batch size.
+        :param minimum: Smallest batch size.
+        :param maximum: Largest batch size.
+        :param target: Batch latency in seconds the size is steered towards.
+        :param step: Routes added to the batch size after each batch which meets the target.
+        :param factor: Fraction the batch size is cut to after a slow or failed batch.
+        :param retries: Failed batches allowed over the whole push.
+        :param backoff: Delay in seconds before the first retry, doubling for each retry in a row.
+        :param backoff_max: Longest delay between retries.
+        """
+        self.lock = threading.Lock()
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.step = step
+        self.factor = factor
+        self.retries = retries
+        self.backoff_base = backoff
+        self.backoff_max = backoff_max
+        self.failures = 0
+        self.timings = []
+
+    @classmethod
+    def from_config(cls, limits):
+        """
+        Build a controller from the routerunner limits section.
+
+        :param limits: The config['routerunner']['limits'] dictionary.
+        :return:
+        """
+        limits = limits or {}
+
+        size = limits.get('patchcount', 300)
+
+        return cls(size=size,
+                   minimum=limits.get('patchmin', min(size, 10)),
+                   maximum=limits.get('patchmax', max(size, 5000)),
+                   target=limits.get('latency', 5.0),
+                   step=limits.get('patchstep', 50),
+                   retries=limits.get('retries', 20),
+                   backoff=limits.get('backoff', 1.0),
+                   backoff_max=limits.get('backoffmax', 60.0))
+
+    def record(self, size, elapsed, status):
+        """
+        Record a batch, and adjust the batch size from how it went.
+
+        :param size: Routes in the batch.
+        :param elapsed: Seconds the batch took.
+        :param status: HTTP status code, or None if the request itself failed.
+        :return: Seconds to pause before the next batch.
+        """
+        log = logging.getLogger("pacing/BatchController.record")
+
+        with self.lock:
+            self.timings.append((size, elapsed, status))
+
+            if status == 204 and elapsed <= self.target:
+                self.size = min(self.maximum, self.size + self.step)
+                pause = 0.0
+            else:
+                self.size = max(self.minimum, int(self.size * self.factor))
+                pause = max(0.0, elapsed - self.target) if status == 204 else 0.0
+
+            log.debug("Batch of {} took {:.2f}s ({}).  Next batch size: {}".format(size, elapsed, status, self.size))
+
+        return pause
+
+    def retry(self, attempt):
+        """
+        Take a retry from the budget.
+
+        :param attempt: Retries of the current batch so far.
+        :return: Seconds to wait before retrying, or None if the retry budget is spent.
+        """
+        with self.lock:
+            self.failures += 1
+            if self.failures > self.retries:
+                return None
+
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+
+        # A little jitter keeps routers which failed together from retrying together.
+        return delay * random.uniform(0.5, 1.0)
+
+    def summary(self):
+        """
+        Summarize the batches recorded so far.
+
+        :return: Dictionary of the batch count, failures, mean and slowest latency, and the final batch size.
+        """
+        with self.lock:
+            elapsed = sorted(timing[1] for timing in self.timings)
+
+            return {'batches': len(self.timings),
+                    'failures': sum(1 for timing in self.timings if timing[2] != 204),
+                    'mean': sum(elapsed) / len(elapsed) if elapsed else 0.0,
+                    'slowest': elapsed[-1] if elapsed else 0.0,
+                    'size': self.size}
+
+
+class ConvergenceTracker:
+    """
+    Tracks a router's FIB as it converges after a large change, such as a base route PUT which timed out.
+
+    The drain rate is estimated from successive prefix counts, and the next poll is timed for about half of the time
+    left at that rate, so a fast router is checked often and a slow one isn't polled for nothing.
+
+    When the expected size is known, the FIB has converged once it comes within a tolerance of it.  The first count may
+    be taken after the drain has begun, and other routes may come and go meanwhile, so the target can be out of reach.
+    A count which has moved and then holds steady for the hold time is taken as converged too, which is long enough
+    that a pause in the drain isn't mistaken for its end.  Without a target, the FIB is taken to have converged once its
+    count holds steady after it has started moving or the grace period has passed.  Tracking gives up once the time
+    budget is spent.
+    """
+
+    def __init__(self, target=None, budget=600.0, poll_min=1.0, poll_max=30.0, grace=15.0, settle=2, tolerance=0.05,
+                 hold=60.0):
+        """
+        :param target: Prefix count expected once converged, or None if it isn't known.
+        :param budget: Seconds allowed for convergence.
+        :param poll_min: Shortest time in seconds between polls.
+        :param poll_max: Longest time in seconds between polls.
+        :param grace: Seconds a steady count is put down to the router not having started yet, without a target.
+        :param settle: Polls in a row with the same count taken as converged.
+        :param tolerance: Fraction of the expected change the count may stay short of the target by.
+        :param hold: Seconds a count which has moved must hold steady to be taken as converged, with a target.
+        """
+        self.target = target
+        self.budget = budget
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.grace = grace
+        self.settle = settle
+        self.tolerance = tolerance
+        self.hold = hold
+
+        self.started = time.monotonic()
+        self.samples = []
+        self.rate = None
+        self.steady = 0
+        self.steady_since = None
+        self.moving = False
+        self.interval = poll_min
+        self.converged = False
+        self.finished = None
+
+    @classmethod
+    def from_config(cls, limits, target=None):
+        """
+        Build a tracker from the routerunner convergence section.
+
+        :param limits: The config['routerunner']['convergence'] dictionary.
+        :param target:
+        :return:
+        """
+        limits = limits or {}
+
+        return cls(target=target,
+                   budget=limits.get('budget', 600.0),
+                   poll_min=limits.get('pollmin', 1.0),
+                   poll_max=limits.get('pollmax', 30.0),
+                   grace=limits.get('grace', 15.0),
+                   settle=limits.get('settle', 2),
+                   tolerance=limits.get('tolerance', 0.05),
+                   hold=limits.get('hold', 60.0))
+
+    def sample(self, count):
+        """
+        Record a prefix count, and decide when to look again.
+
+        :param count: Prefixes in the FIB, or None if the count could not be read.
+        :return: Seconds to wait before the next sample, or None once converged or out of time.
+        """
+        log = logging.getLogger("pacing/ConvergenceTracker.sample")
+
+        now = time.monotonic()
+        elapsed = now - self.started
+
+        if count is not None:
+            if self.samples:
+                last_time, last_count = self.samples[-1]
+
+                if count == last_count:
+                    self.steady += 1
+                else:
+                    self.steady = 0
+                    self.steady_since = now
+                    self.moving = True
+
+                    # Weight the latest interval evenly with everything before it.
+                    rate = abs(last_count - count) / max(now - last_time, 1e-6)
+                    self.rate = rate if self.rate is None else (self.rate + rate) / 2
+
+            else:
+                self.steady_since = now
+
+            self.samples.append((now, count))
+
+            if self.target is not None:
+                slack = self.tolerance * max(0, self.samples[0][1] - self.target)
+
+                if count <= self.target + slack:
+                    log.debug("FIB reached {} prefixes, within {:.0f} of {}.".format(count, slack, self.target))
+                    return self.finish(now, True)
+
+                if self.moving and self.steady >= self.settle - 1 and now - self.steady_since >= self.hold:
+                    log.debug("FIB steady at {} prefixes for {:.1f}s, short of {}.".format(
+                        count, now - self.steady_since, self.target))
+                    return self.finish(now, True)
+
+            if self.target is None and self.steady >= self.settle - 1 and len(self.samples) > 1 and \
+                    (self.moving or elapsed >= self.grace):
+                log.debug("FIB steady at {} prefixes.".format(count))
+                return self.finish(now, True)
+
+            if self.moving and self.rate and self.target is not None:
+                # Look again about half way through the time left at the current rate.
+                self.interval = (count - self.target) / self.rate / 2
+            elif self.moving:
+                self.interval = self.poll_min
+            elif self.target is not None:
+                # Only the target will do, so back off until the router gets going.
+                self.interval = self.interval * 2
+            else:
+                # The router hasn't started yet, so back off, but not past the end of the grace period.
+                self.interval = min(self.interval * 2, max(self.grace - elapsed, self.poll_min))
+
+        self.interval = max(self.poll_min, min(self.poll_max, self.interval))
+
+        if elapsed + self.interval > self.budget:
+            if elapsed >= self.budget:
+                log.debug("Convergence budget of {}s spent.".format(self.budget))
+                return self.finish(now, False)
+            return self.budget - elapsed
+
+        log.debug("FIB count {}, rate {}/s.  Next poll in {:.1f}s.".format(count, self.rate, self.interval))
+
+        return self.interval
+
+    def finish(self, now, converged):
+        """
+        Mark tracking as over.
+
+        :param now:
+        :param converged:
+        :return: None, for sample to hand back.
+        """
+        self.converged = converged
+        self.finished = now
+        return None
+
+    def summary(self):
+        """
+        Summarize the convergence.
+
+        :return: Dictionary of whether the FIB converged, the seconds taken, the polls made, the prefixes drained or
+                 added, and the mean rate per second.
+        """
+        counts = [sample[1] for sample in self.samples]
+        elapsed = (self.finished or time.monotonic()) - self.started
+
+        return {'converged': self.converged,
+                'elapsed': elapsed,
+                'samples': len(self.samples),
+                'change': abs(counts[0] - counts[-1]) if counts else 0,
+                'rate': abs(counts[0] - counts[-1]) / elapsed if counts and elapsed else 0.0}
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+from prefixset import int_to_prefix
+
+# Internal Imports
+import bisect
+import hashlib
+import json
+import logging
+
+# Dotted masks, indexed by prefix length.
+MASKS = [int_to_prefix((0xFFFFFFFF << (32 - bits)) & 0xFFFFFFFF, bits).split('/')[0] for bits in range(33)]
+
+BATCH_HEAD = b'{"Cisco-IOS-XE-native:route": {"ip-route-interface-forwarding-list": ['
+BATCH_TAIL = b']}}'
+
+
+class RoutePayload:
+    """
+    IOS-XE static route entries for a set of routes, serialized once and shared by every router in a run.
+
+    Each route is held as its own JSON fragment, in network order.  The forwarding part of a fragment is built once
+    for each distinct route name and tag, and the mask once for each prefix length, so the per-route work is little
+    more than formatting the prefix.  A batch of any size is then just the fragments joined together.  The generation
+    identifies the routes, and defaults to a digest of every fragment.
+    """
+
+    def __init__(self, routes, generation=None):
+        """
+        :param routes: Labelled PrefixSet of routes, where each label is a tuple of (name, tag).
+        :param generation: Identifier of the routes, such as a fingerprint of the block list they came from, or None
+                           to use a digest of every fragment.
+        """
+        log = logging.getLogger("payload/RoutePayload")
+
+        forwarding = {}
+        for name, tag in routes.labels:
+            fwd = {'fwd': "Null0", 'name': "{}".format(name)}
+            if tag is not None:
+                fwd['tag'] = tag
+            forwarding[(name, tag)] = json.dumps([fwd])
+
+        self.fragments = []
+
+        for network, bits, label in routes.entries():
+            self.fragments.append('{{"fwd-list": {}, "prefix": "{}.{}.{}.{}", "mask": "{}"}}'.format(
+                forwarding[label], network >> 24, (network >> 16) & 255, (network >> 8) & 255, network & 255,
+                MASKS[bits]).encode())
+
+        self.keys = routes.keys
+
+        # The generation identifies exactly what is being pushed, so an interrupted push can tell if it can resume.
+        if generation is None:
+            digest = hashlib.sha256()
+            for fragment in self.fragments:
+                digest.update(fragment)
+            generation = digest.hexdigest()
+
+        self.generation = generation
+
+        log.debug("Serialized {} routes with {} distinct labels.".format(len(self.fragments), len(forwarding)))
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def select(self, routes):
+        """
+        Return the fragments for a subset of the routes, such as the changes for one router.
+
+        :param routes: PrefixSet whose prefixes are all in this payload.
+        :return: List of fragments, in network order.
+        """
+        routes._compact()
+
+        fragments = []
+        for key in routes.keys:
+            i = bisect.bisect_left(self.keys, key)
+            if i < len(self.keys) and self.keys[i] == key:
+                fragments.append(self.fragments[i])
+
+        return fragments
+
+
+def route_batch(fragments):
+    """
+    Join route fragments into the body of a PATCH request.
+
+    :param fragments: List of fragments.
+    :return: Request body as bytes.
+    """
+    return BATCH_HEAD + b", ".join(fragments) + BATCH_TAIL
+
+
+def route_removal(routes):
+    """
+    Build the body of a YANG Patch request which removes routes from the route container.  Each route is a remove
+    edit, which unlike a delete doesn't fail the whole patch if the route is already gone.
+
+    :param routes: List of (network, bits) routes.
+    :return: Request body as bytes.
+    """
+    edits = []
+    for network, bits in routes:
+        edits.append({'edit-id': "{}".format(len(edits)), 'operation': "remove",
+                      'target': "/ip-route-interface-forwarding-list={},{}".format(
+                          int_to_prefix(network, bits).split('/')[0], MASKS[bits])})
+
+    return json.dumps({'ietf-yang-patch:yang-patch': {'patch-id': "rtbh-remove", 'edit': edits}}).encode()
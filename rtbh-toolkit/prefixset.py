@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+
+# Internal Imports
+import array
+import bisect
+import ipaddress
+import itertools
+import operator
+
+
+def prefix_to_int(prefix):
+    """
+    Convert a CIDR string into a tuple of (version, network integer, prefix length).
+
+    IPv4 prefixes are parsed directly from their octets.  Anything else is handed to the ipaddress module.  Host bits
+    are masked off rather than rejected.
+
+    :param prefix:
+    :return: Tuple, or None if the prefix cannot be parsed.
+    """
+    addr, _, bits = prefix.strip().partition('/')
+
+    octets = addr.split('.')
+    if len(octets) == 4:
+        try:
+            value = 0
+            for octet in octets:
+                octet = int(octet)
+                if not 0 <= octet <= 255:
+                    return None
+                value = (value << 8) | octet
+            bits = int(bits) if bits else 32
+        except ValueError:
+            return None
+
+        if not 0 <= bits <= 32:
+            return None
+
+        return 4, value & ((0xFFFFFFFF << (32 - bits)) & 0xFFFFFFFF), bits
+
+    try:
+        network = ipaddress.ip_network(prefix.strip(), strict=False)
+    except ValueError:
+        return None
+
+    return network.version, int(network.network_address), network.prefixlen
+
+
+def int_to_prefix(network, bits):
+    """
+    Convert an IPv4 network integer and prefix length back into a CIDR string.
+
+    :param network:
+    :param bits:
+    :return:
+    """
+    return "{}.{}.{}.{}/{}".format(network >> 24, (network >> 16) & 255, (network >> 8) & 255, network & 255, bits)
+
+
+# Every octet and prefix length spelling accepted by the regular expressions this parser replaced, leading zeros and all.
+_V4_OCTETS = {}
+for _value in range(256):
+    for _width in range(len(str(_value)), 4):
+        _V4_OCTETS[str(_value).zfill(_width)] = _value
+_V4_BITS = {str(_value): _value for _value in range(33)}
+_V4_NETMASKS = [(0xFFFFFFFF << (32 - _value)) & 0xFFFFFFFF for _value in range(33)]
+
+
+def parse_v4_lines(content, masked=True):
+    """
+    Parse lines of IPv4 hosts or prefixes into a prefix set, without a regular expression.
+
+    Anything after a '#' or ';' is treated as a comment, and only the first word left on the line is read, so annotated
+    feeds such as the Spamhaus DROP list parse cleanly.  Each octet is looked up straight from its text, and the packed
+    keys are collected before the set is built in one go.  Host bits are masked off rather than rejected, the same as
+    the set itself does.
+
+    :param content: Iterable of lines.
+    :param masked: Expect a prefix length on every entry.  Otherwise, entries are hosts and are stored as /32s.
+    :return: Tuple of the PrefixSet, and a dictionary of line counts: lines, blank, accepted, and the rejections by
+             reason of format, octet and mask.
+    """
+    octet = _V4_OCTETS.get
+    netmasks = _V4_NETMASKS
+
+    keys = []
+    append = keys.append
+
+    lines = 0
+    blank = 0
+    bad_format = 0
+    bad_octet = 0
+    bad_mask = 0
+
+    for line in content:
+        lines += 1
+
+        if '#' in line:
+            line = line.split('#', 1)[0]
+        if ';' in line:
+            line = line.split(';', 1)[0]
+
+        words = line.split(None, 1)
+        if not words:
+            blank += 1
+            continue
+
+        addr, slash, bits = words[0].partition('/')
+
+        octets = addr.split('.')
+        if len(octets) != 4 or (slash != '') != masked:
+            bad_format += 1
+            continue
+
+        a, b, c, d = octets
+        a, b, c, d = octet(a), octet(b), octet(c), octet(d)
+        if a is None or b is None or c is None or d is None:
+            if addr.replace('.', '').isdigit():
+                bad_octet += 1
+            else:
+                bad_format += 1
+            continue
+
+        if masked:
+            bits = _V4_BITS.get(bits)
+            if bits is None:
+                bad_mask += 1
+                continue
+        else:
+            bits = 32
+
+        append(((((a << 24) | (b << 16) | (c << 8) | d) & netmasks[bits]) << 6) | bits)
+
+    stats = {'lines': lines, 'blank': blank, 'accepted': len(keys), 'format': bad_format, 'octet': bad_octet,
+             'mask': bad_mask}
+
+    return PrefixSet.from_keys(keys), stats
+
+
+def collapse_prefixes(entries, shortest=0):
+    """
+    Collapse adjacent and contained IPv4 prefixes, in the manner of ipaddress.collapse_addresses but over integers.
+
+    A prefix inside the one before it is absorbed, and two halves of the same block are merged into it, over and over
+    for as long as the merged block is no shorter than the given prefix length.  Prefixes which are already shorter
+    are kept as they are.
+
+    :param entries: Iterable of (network integer, prefix length, label) tuples, in network order.
+    :param shortest: Shortest prefix length a merge may produce.
+    :return: List of (network integer, prefix length, set of labels) tuples, in network order.
+    """
+    netmasks = _V4_NETMASKS
+    stack = []
+
+    for network, bits, label in entries:
+        if stack:
+            top_network, top_bits, top_labels = stack[-1]
+            if bits >= top_bits and network & netmasks[top_bits] == top_network:
+                top_labels.add(label)
+                continue
+
+        stack.append((network, bits, {label}))
+
+        while len(stack) > 1:
+            right_network, right_bits, right_labels = stack[-1]
+            left_network, left_bits, left_labels = stack[-2]
+
+            if left_bits != right_bits or right_bits <= shortest:
+                break
+
+            size = 1 << (32 - right_bits)
+            if left_network & size or left_network + size != right_network:
+                break
+
+            stack.pop()
+            stack[-1] = (left_network, left_bits - 1, left_labels | right_labels)
+
+    return stack
+
+
+class PrefixSet:
+    """
+    A compact, sorted set of IPv4 prefixes with a value attached to each one.  IPv6 prefixes are not supported, and are
+    counted apart from invalid ones when added, so they can be reported.
+
+    Each prefix is packed into a single unsigned 64-bit key of (network << 6 | prefix length) and held in an array,
+    with the values in a parallel array.  Sorting by key keeps the set in network order.  A labelled set interns its
+    values, such as a source string, and stores the label index instead.
+
+    Entries may be added in any order.  Duplicates are resolved the same way a dictionary update would, with the last
+    value winning, when the set is next read.
+    """
+
+    def __init__(self, typecode='f', labelled=False):
+        """
+        :param typecode: Array typecode used to store values.
+        :param labelled: Store interned labels instead of numeric values.
+        """
+        self.keys = array.array('Q')
+        self.labels = [] if labelled else None
+        self.label_index = {} if labelled else None
+        self.values = array.array('I' if labelled else typecode)
+        self.invalid = 0
+        self.ipv6 = 0
+        self.ordered = True
+
+    @classmethod
+    def from_keys(cls, keys, typecode='f', values=None):
+        """
+        Build a set from packed keys.
+
+        :param keys: Iterable of (network << 6 | prefix length) keys, in any order.
+        :param typecode: Array typecode used to store values.
+        :param values: Iterable of values parallel to the keys.  Every value is zero without them.
+        :return:
+        """
+        result = cls(typecode)
+        result.keys = array.array('Q', keys)
+        if values is None:
+            result.values = array.array(typecode, [0]) * len(result.keys)
+        else:
+            result.values = array.array(typecode, values)
+        result.ordered = len(result.keys) < 2
+        return result
+
+    def _empty_like(self):
+        """
+        Return an empty set sharing this set's value type and labels.
+        """
+        result = PrefixSet(self.values.typecode)
+        result.labels = self.labels
+        result.label_index = self.label_index
+        return result
+
+    def _compact(self):
+        """
+        Sort the keys and drop any duplicates, if anything has been added out of order.
+        """
+        if self.ordered:
+            return
+
+        merged = dict(zip(self.keys, self.values))
+        order = sorted(merged)
+
+        self.keys = array.array('Q', order)
+        self.values = array.array(self.values.typecode, map(merged.__getitem__, order))
+        self.ordered = True
+
+    def _find(self, prefix):
+        """
+        Return the position of a prefix in the set, or None if it isn't there.
+        """
+        key = prefix_to_int(prefix)
+        if key is None or key[0] != 4:
+            return None
+
+        self._compact()
+
+        key = (key[1] << 6) | key[2]
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            return i
+
+        return None
+
+    def _value(self, i):
+        """
+        Return the value, or label, at a given position.
+        """
+        if self.labels is not None:
+            return self.labels[self.values[i]]
+
+        return self.values[i]
+
+    def add(self, prefix, value=0):
+        """
+        Add a prefix to the set.  IPv6 prefixes, and anything that isn't a valid prefix, are counted and ignored.
+
+        :param prefix: CIDR string.
+        :param value: Score, or label for a labelled set.
+        :return: True if the prefix was added.
+        """
+        key = prefix_to_int(prefix)
+        if key is None:
+            self.invalid += 1
+            return False
+
+        if key[0] != 4:
+            self.ipv6 += 1
+            return False
+
+        self.add_int(key[1], key[2], value)
+        return True
+
+    def add_int(self, network, bits, value=0):
+        """
+        Add an already converted IPv4 prefix to the set.
+
+        :param network:
+        :param bits:
+        :param value: Score, or label for a labelled set.
+        :return:
+        """
+        key = (network << 6) | bits
+
+        if self.ordered and self.keys and key <= self.keys[-1]:
+            self.ordered = False
+
+        if self.labels is not None:
+            label = self.label_index.get(value)
+            if label is None:
+                label = len(self.labels)
+                self.labels.append(value)
+                self.label_index[value] = label
+            value = label
+        elif self.values.typecode in 'fd':
+            value = float(value)
+
+        self.keys.append(key)
+        self.values.append(value)
+
+    def __len__(self):
+        self._compact()
+        return len(self.keys)
+
+    def __contains__(self, prefix):
+        return self._find(prefix) is not None
+
+    def __getitem__(self, prefix):
+        i = self._find(prefix)
+        if i is None:
+            raise KeyError(prefix)
+
+        return self._value(i)
+
+    def get(self, prefix, default=None):
+        """
+        Return the value for a prefix, or the default if it is not in the set.
+        """
+        i = self._find(prefix)
+        if i is None:
+            return default
+
+        return self._value(i)
+
+    def __iter__(self):
+        self._compact()
+        for key in self.keys:
+            yield int_to_prefix(key >> 6, key & 63)
+
+    def networks(self):
+        """
+        Yield each prefix as a tuple of (network integer, prefix length), in network order.
+        """
+        self._compact()
+        for key in self.keys:
+            yield key >> 6, key & 63
+
+    def entries(self):
+        """
+        Yield each prefix as a tuple of (network integer, prefix length, value), in network order.
+        """
+        self._compact()
+        for i, key in enumerate(self.keys):
+            yield key >> 6, key & 63, self._value(i)
+
+    def items(self):
+        """
+        Yield each prefix as a tuple of (CIDR string, value), in network order.
+        """
+        self._compact()
+        for i, key in enumerate(self.keys):
+            yield int_to_prefix(key >> 6, key & 63), self._value(i)
+
+    def select(self, selectors):
+        """
+        Return a new set containing the entries picked out by an iterable of booleans.
+        """
+        self._compact()
+
+        result = self._empty_like()
+        selectors = list(selectors)
+        result.keys = array.array('Q', itertools.compress(self.keys, selectors))
+        result.values = array.array(self.values.typecode, itertools.compress(self.values, selectors))
+        return result
+
+    def _members(self, other):
+        """
+        Yield whether each prefix of this set, in network order, is also in the other set.  Both sets' keys are sorted
+        and unique, so the two arrays are walked together in a single pass.
+
+        :param other: PrefixSet
+        :return:
+        """
+        self._compact()
+        other._compact()
+
+        other_keys = other.keys
+        other_count = len(other_keys)
+        j = 0
+
+        for key in self.keys:
+            while j < other_count and other_keys[j] < key:
+                j += 1
+            yield j < other_count and other_keys[j] == key
+
+    def difference(self, other):
+        """
+        Return the entries of this set whose prefix is not in the other set.
+
+        :param other: PrefixSet
+        :return: PrefixSet with this set's values.
+        """
+        return self.select(map(operator.not_, self._members(other)))
+
+    def intersection(self, other):
+        """
+        Return the entries of this set whose prefix is also in the other set.
+
+        :param other: PrefixSet
+        :return: PrefixSet with this set's values.
+        """
+        return self.select(self._members(other))
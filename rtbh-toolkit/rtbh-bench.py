@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+
+from globals import *
+from pacing import BatchController
+from payload import RoutePayload, route_batch
+from prefixset import PrefixSet, parse_v4_lines
+
+# Internal Imports
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import random
+import re
+import time
+import types
+
+
+def cli_args():
+    """
+    Process CLI Arguments and return the namespace.
+
+    :return:
+    """
+    _logger = logging.getLogger("rtbh-bench/cli_args")
+
+    cli_parser = argparse.ArgumentParser(description="RTBH Benchmark Utility v{}".format(version),
+                                         epilog="This program times the toolkit's hot paths against synthetic data.")
+
+    cli_parser.add_argument('-d', '--debug',
+                            action='store_true',
+                            help="Enable script debugging.  This is a LOT of output.")
+
+    sub_parser = cli_parser.add_subparsers(help='Benchmarks',
+                                           required=True)
+
+    # Parse Sub Parser
+    op_parse = sub_parser.add_parser('parse',
+                                     help='Compare the IPv4 line parser against the regular expression it replaced.')
+    op_parse.set_defaults(operation='parse')
+    op_parse.add_argument('--lines',
+                          action='store',
+                          type=int,
+                          default=1000000,
+                          help='Number of synthetic feed lines.  1,000,000 is default.')
+    op_parse.add_argument('--seed',
+                          action='store',
+                          type=int,
+                          default=1,
+                          help='Random seed for the synthetic feed.')
+
+    # Payload Sub Parser
+    op_payload = sub_parser.add_parser('payload',
+                                       help='Compare shared route payloads against building routes per router.')
+    op_payload.set_defaults(operation='payload')
+    op_payload.add_argument('--routes',
+                            action='store',
+                            type=int,
+                            default=100000,
+                            help='Number of synthetic routes.  100,000 is default.')
+    op_payload.add_argument('--routers',
+                            action='store',
+                            type=int,
+                            default=3,
+                            help='Number of routers the routes are deployed to.  3 is default.')
+    op_payload.add_argument('--batch',
+                            action='store',
+                            type=int,
+                            default=300,
+                            help='Routes per batch.  300 is default.')
+    op_payload.add_argument('--seed',
+                            action='store',
+                            type=int,
+                            default=1,
+                            help='Random seed for the synthetic routes.')
+
+    # Router Sub Parser
+    op_router = sub_parser.add_parser('router',
+                                      help='Time routerunner pushes against the IOS-XE simulator.')
+    op_router.set_defaults(operation='router')
+    op_router.add_argument('--sizes',
+                           action='store',
+                           default='10000,100000,1000000',
+                           help='Comma separated route counts.  10000,100000,1000000 is default.')
+    op_router.add_argument('--window',
+                           action='store',
+                           type=int,
+                           default=1,
+                           help='Batches in flight at once.  1 is default.')
+    op_router.add_argument('--latency',
+                           action='store',
+                           type=float,
+                           default=0.0,
+                           help='Seconds the simulator adds to every request.')
+    op_router.add_argument('--route-latency',
+                           action='store',
+                           type=float,
+                           default=0.0,
+                           help='Seconds the simulator adds for each route written or removed.')
+    op_router.add_argument('--timeout',
+                           action='store',
+                           type=float,
+                           default=0.0,
+                           help='Seconds after which the simulator answers a write with a 504.  0 (never) is default.')
+    op_router.add_argument('--fib-rate',
+                           action='store',
+                           type=float,
+                           default=0.0,
+                           help='Prefixes per second the simulated FIB converges at.  0 (at once) is default.')
+    op_router.add_argument('--seed',
+                           action='store',
+                           type=int,
+                           default=1,
+                           help='Random seed for the synthetic routes.')
+
+    # Assign the arguments to a variable
+    arguments = cli_parser.parse_args()
+
+    if vars(arguments)['debug']:
+        logging.basicConfig(level=logging.DEBUG)
+        _logger.debug("Debug Logging Enabled")
+
+    return arguments
+
+
+def synthetic_v4_feed(lines, masked=True, seed=1):
+    """
+    Build a synthetic feed of IPv4 entries.  Most lines are clean, with a sprinkling of comments, annotated entries,
+    blank lines and garbage, roughly in the proportions seen on public feeds.
+
+    :param lines: Number of lines.
+    :param masked: Give each entry a prefix length.
+    :param seed:
+    :return: List of lines.
+    """
+    generator = random.Random(seed)
+
+    content = []
+    for i in range(lines):
+        kind = generator.random()
+        addr = "{}.{}.{}.{}".format(generator.randint(1, 223), generator.randint(0, 255), generator.randint(0, 255),
+                                    generator.randint(0, 255))
+        if masked:
+            addr += "/{}".format(generator.randint(8, 32))
+
+        if kind < 0.90:
+            content.append(addr)
+        elif kind < 0.95:
+            content.append("{} ; SBL{}".format(addr, i))
+        elif kind < 0.97:
+            content.append("# ticket {}".format(i))
+        elif kind < 0.99:
+            content.append("")
+        else:
+            content.append("{}.999".format(addr))
+
+    return content
+
+
+def regex_v4_lines(content, masked=True):
+    """
+    The regular expression parser used by the listrunner before parse_v4_lines, kept as a baseline.
+
+    :param content: Iterable of lines.
+    :param masked:
+    :return: PrefixSet
+    """
+    if masked:
+        v4_regex = re.compile('^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)'
+                              '\\/(3[0-2]|[1-2][0-9]|[0-9])$')
+    else:
+        v4_regex = re.compile('^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$')
+
+    prefixes = PrefixSet()
+
+    for line in content:
+        if v4_regex.match(line):
+            prefixes.add(line)
+
+    return prefixes
+
+
+def op_parse(lines, seed):
+    """
+    Time both IPv4 line parsers against the same synthetic feeds.
+
+    :param lines:
+    :param seed:
+    :return:
+    """
+    for masked in (True, False):
+        content = synthetic_v4_feed(lines, masked, seed)
+
+        started = time.perf_counter()
+        regex_set = regex_v4_lines(content, masked)
+        regex_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        parsed_set, stats = parse_v4_lines(content, masked)
+        parsed_time = time.perf_counter() - started
+
+        print("Feed.......: {} ({} lines)".format("v4_host_mask" if masked else "v4_host", lines))
+        print("Regex......: {:.3f}s, {} prefixes".format(regex_time, len(regex_set)))
+        print("Parser.....: {:.3f}s, {} prefixes".format(parsed_time, len(parsed_set)))
+        print("Speedup....: {:.1f}x".format(regex_time / parsed_time if parsed_time else 0))
+        print("Rejected...: {} format, {} octet, {} mask, {} blank".format(stats['format'], stats['octet'],
+                                                                         stats['mask'], stats['blank']))
+        print()
+
+
+def synthetic_routes(count, seed=1):
+    """
+    Build a synthetic set of routes, labelled with a route name and tag the way blocklist_routes labels them.
+
+    :param count: Number of routes.
+    :param seed:
+    :return: Labelled PrefixSet
+    """
+    generator = random.Random(seed)
+    labels = [("LR-LIST{}".format(i), 6000 + i) for i in range(8)] + [("LR-LIST0|LR-LIST1", 6660)]
+
+    routes = PrefixSet(labelled=True)
+    while len(routes.keys) < count:
+        bits = generator.choice([32, 32, 32, 32, 24, 28])
+        network = generator.getrandbits(32) & ((0xFFFFFFFF << (32 - bits)) & 0xFFFFFFFF)
+        routes.add_int(network, bits, generator.choice(labels))
+
+    return routes
+
+
+def legacy_bits_to_mask(bits):
+    """
+    Convert a prefix length to a dotted mask from scratch on every call, standing in for iupy.v4_bits_to_mask.
+
+    :param bits:
+    :return:
+    """
+    mask = (0xFFFFFFFF << (32 - int(bits))) & 0xFFFFFFFF
+    return "{}.{}.{}.{}".format(mask >> 24, (mask >> 16) & 255, (mask >> 8) & 255, mask & 255)
+
+
+def legacy_route_batches(routes, batch):
+    """
+    Build and serialize route batches one route at a time, the way route_processor did for every router.
+
+    :param routes: Labelled PrefixSet of (name, tag) routes.
+    :param batch: Routes per batch.
+    :return: Total bytes serialized.
+    """
+    tag_list = {"LR-LIST{}".format(i): 6000 + i for i in range(8)}
+
+    total = 0
+    routes_list = []
+
+    for block_addr, (block_name, block_tag) in routes.items():
+        entry_dict = {'fwd-list': [{'fwd': "Null0", 'name': "{}".format(block_name)}]}
+        entry_dict['fwd-list'][0]['tag'] = tag_list.get(block_name, 6660)
+
+        ip_record = block_addr.split('/')
+        entry_dict['prefix'] = ip_record[0]
+        entry_dict['mask'] = legacy_bits_to_mask(ip_record[1])
+
+        routes_list.append(entry_dict)
+
+        if len(routes_list) == batch:
+            total += len(json.dumps({'Cisco-IOS-XE-native:route': {'ip-route-interface-forwarding-list': routes_list}}))
+            routes_list = []
+
+    if routes_list:
+        total += len(json.dumps({'Cisco-IOS-XE-native:route': {'ip-route-interface-forwarding-list': routes_list}}))
+
+    return total
+
+
+def op_payload(count, routers, batch, seed):
+    """
+    Time building route batches for each router against serializing them once and joining them per router.
+
+    :param count:
+    :param routers:
+    :param batch:
+    :param seed:
+    :return:
+    """
+    routes = synthetic_routes(count, seed)
+
+    started = time.perf_counter()
+    for router in range(routers):
+        legacy_route_batches(routes, batch)
+    legacy_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    payload = RoutePayload(routes)
+    build_time = time.perf_counter() - started
+
+    for router in range(routers):
+        for start in range(0, len(payload), batch):
+            route_batch(payload.fragments[start:start + batch])
+    shared_time = time.perf_counter() - started
+
+    print("Routes.....: {} to {} routers, {} per batch".format(len(routes), routers, batch))
+    print("Per router.: {:.3f}s".format(legacy_time))
+    print("Shared.....: {:.3f}s ({:.3f}s to serialize)".format(shared_time, build_time))
+    print("Speedup....: {:.1f}x".format(legacy_time / shared_time if shared_time else 0))
+    print()
+
+
+def simulator_process(ports, latency, route_latency, timeout=0.0, fib_rate=0.0):
+    """
+    Serve a simulated router until terminated, reporting the port it listens on.  The simulator runs in its own
+    process, so it doesn't compete with the routerunner for the interpreter.
+
+    :param ports: Queue the port is put on.
+    :param latency:
+    :param route_latency:
+    :param timeout:
+    :param fib_rate:
+    :return:
+    """
+    simulator_xe = importlib.import_module('rtbh-simulator-xe')
+
+    simulator = simulator_xe.RouterSimulator(latency=latency, route_latency=route_latency, timeout=timeout,
+                                             fib_rate=fib_rate)
+    simulator.add_base(10, "DEFAULT")
+
+    server = simulator_xe.simulator_server(simulator)
+    ports.put(server.server_address[1])
+    server.serve_forever()
+
+
+def router_push(runner, session, entry, routes, payload, window):
+    """
+    Bring the simulated router in line with a set of routes, the way an incremental routerunner sync does.
+
+    :param runner: The routerunner module.
+    :param session:
+    :param entry:
+    :param routes: Labelled PrefixSet of routes.
+    :param payload: RoutePayload of the same routes.
+    :param window:
+    :return: Dictionary of the timings and route counts.
+    """
+    started = time.perf_counter()
+
+    base_routes, current = runner.route_retrieve(session, entry)
+    deploy, stale = runner.route_diff(current, routes)
+    diff_time = time.perf_counter() - started
+
+    runner.route_remove(session, entry, stale)
+
+    controller = BatchController.from_config(runner.config['routerunner']['limits'])
+    if not runner.route_patch(session, entry, payload.select(deploy), controller, window):
+        print("Push failed.")
+
+    return {'diff': diff_time,
+            'total': time.perf_counter() - started,
+            'deployed': len(deploy),
+            'removed': len(stale),
+            'batches': controller.summary()}
+
+
+def router_full(runner, session, entry, payload, window):
+    """
+    Replace every route on the simulated router, the way a full routerunner sync does.  The managed routes are dropped
+    with a PUT of the base routes, and if the PUT times out, the FIB is followed until it has drained.
+
+    :param runner: The routerunner module.
+    :param session:
+    :param entry:
+    :param payload: RoutePayload of the routes to deploy.
+    :param window:
+    :return: Dictionary of the timings, the PUT status, the convergence summary or None, and the batch summary.
+    """
+    started = time.perf_counter()
+
+    base_routes, current = runner.route_retrieve(session, entry)
+
+    body = json.dumps({'Cisco-IOS-XE-native:route': {'ip-route-interface-forwarding-list': base_routes}}).encode()
+    status, put_time = runner.restconf_send(session, 'PUT', runner.restconf_url(entry, "data/native/ip/route"), body)
+
+    # restconf_fib_size expects a RESTCONF connection, which only needs to answer a get.
+    router = types.SimpleNamespace(get=lambda path: session.get(runner.restconf_url(entry, path)))
+
+    convergence = None
+    if status == 504:
+        convergence = runner.fib_converge(router, len(current)).summary()
+    elif status != 204:
+        print("Base route PUT failed: {}".format(status))
+
+    controller = BatchController.from_config(runner.config['routerunner']['limits'])
+    if not runner.route_patch(session, entry, payload.fragments, controller, window):
+        print("Push failed.")
+
+    return {'put': put_time,
+            'status': status,
+            'total': time.perf_counter() - started,
+            'removed': len(current),
+            'deployed': len(payload),
+            'convergence': convergence,
+            'batches': controller.summary()}
+
+
+def router_churn(routes, fraction, seed):
+    """
+    Replace a fraction of a set of routes with new ones.
+
+    :param routes: Labelled PrefixSet of routes.
+    :param fraction:
+    :param seed:
+    :return: Labelled PrefixSet
+    """
+    churned = PrefixSet(labelled=True)
+    step = int(1 / fraction)
+
+    for i, (network, bits, label) in enumerate(routes.entries()):
+        if i % step:
+            churned.add_int(network, bits, label)
+
+    for network, bits, label in synthetic_routes(len(routes) // step, seed + 1).entries():
+        churned.add_int(network, bits, label)
+
+    return churned
+
+
+def op_router(sizes, window, latency, route_latency, seed, timeout=0.0, fib_rate=0.0):
+    """
+    Time an initial push, an unchanged re-sync and a 1% churn at each size against the IOS-XE simulator, followed by a
+    full sync.  With a timeout, a full sync whose PUT outlasts it is answered with a 504, and the FIB is followed as it
+    drains at the simulator's FIB rate, as route_processor does.
+
+    The routerunner's retrieval, comparison, removal, convergence and patch functions are driven directly, since
+    route_processor needs the database for its process locks.
+
+    :param sizes: List of route counts.
+    :param window:
+    :param latency:
+    :param route_latency:
+    :param seed:
+    :param timeout:
+    :param fib_rate:
+    :return:
+    """
+    runner = importlib.import_module('rtbh-routerunner-xe')
+
+    runner.config['routerunner'] = {'tags': {'basename': "DEFAULT"},
+                                    'verify': False,
+                                    'limits': {'patchcount': 300, 'window': window},
+                                    'convergence': {'pollmin': 0.1, 'pollmax': 2.0, 'grace': 2.0, 'hold': 2.0}}
+    runner.config['routercred'] = {'un': "bench", 'pw': "bench"}
+
+    for count in sizes:
+        ports = multiprocessing.Queue()
+        process = multiprocessing.Process(target=simulator_process, args=(ports, latency, route_latency, timeout, fib_rate),
+                                          daemon=True)
+        process.start()
+
+        entry = {'ident': "127.0.0.1:{}".format(ports.get()), 'transport': "http"}
+        session = runner.restconf_session(entry, window)
+
+        try:
+            routes = synthetic_routes(count, seed)
+            started = time.perf_counter()
+            payload = RoutePayload(routes)
+            payload_time = time.perf_counter() - started
+
+            print("Routes.....: {} ({:.3f}s to serialize), window {}".format(len(routes), payload_time, window))
+
+            for name, push_routes in (("Initial", routes), ("Unchanged", routes), ("Churn 1%", None)):
+                if push_routes is None:
+                    push_routes = router_churn(routes, 0.01, seed)
+                    payload = RoutePayload(push_routes)
+
+                result = router_push(runner, session, entry, push_routes, payload, window)
+                print("{:.<11}: {:.3f}s, first diff at {:.3f}s, {} deployed, {} removed, {} batches, "
+                      "final size {}".format(name, result['total'], result['diff'], result['deployed'],
+                                             result['removed'], result['batches']['batches'],
+                                             result['batches']['size']))
+
+            result = router_full(runner, session, entry, RoutePayload(routes), window)
+            print("{:.<11}: {:.3f}s, PUT {:.3f}s ({}), {} removed, {} deployed, {} batches, final size {}".format(
+                "Full", result['total'], result['put'], result['status'], result['removed'], result['deployed'],
+                result['batches']['batches'], result['batches']['size']))
+
+            fib_summary = result['convergence']
+            if fib_summary is not None:
+                print("{:.<11}: {} in {:.3f}s over {} polls, {} prefixes at {:.0f}/s".format(
+                    "FIB", "converged" if fib_summary['converged'] else "timed out", fib_summary['elapsed'],
+                    fib_summary['samples'], fib_summary['change'], fib_summary['rate']))
+
+        finally:
+            session.close()
+            process.terminate()
+            process.join()
+
+        print()
+
+
+if __name__ == "__main__":
+
+    logger = logging.getLogger("rtbh-bench")
+
+    # Process CLI Arguments
+    args = cli_args()
+
+    print()
+
+    # Perform our benchmarks
+    if vars(args)['operation'] == 'parse':
+        op_parse(vars(args)['lines'], vars(args)['seed'])
+    elif vars(args)['operation'] == 'payload':
+        op_payload(vars(args)['routes'], vars(args)['routers'], vars(args)['batch'], vars(args)['seed'])
+    elif vars(args)['operation'] == 'router':
+        op_router([int(size) for size in vars(args)['sizes'].split(',')], vars(args)['window'], vars(args)['latency'],
+                  vars(args)['route_latency'], vars(args)['seed'], vars(args)['timeout'], vars(args)['fib_rate'])
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from globals import *
+from changelog import changelog_compact
 
 # Internal Imports
 import argparse
@@ -58,6 +59,24 @@ def cli_args():
                                      help='This option will flush the database tables.')
     op_flush.set_defaults(operation='flush')
 
+    # Database Upgrade Sub Parser
+    op_upgrade = sub_parser.add_parser('upgrade',
+                                       help='This option will add any missing tables to an existing database.')
+    op_upgrade.set_defaults(operation='upgrade')
+
+    # Database Compact Sub Parser
+    op_compact = sub_parser.add_parser('compact',
+                                       help='This option will compact the change log.')
+    op_compact.set_defaults(operation='compact')
+    op_compact.add_argument('--through',
+                            action='store',
+                            type=int,
+                            default=None,
+                            help='Last sequence number to compact.  The whole change log is default.')
+    op_compact.add_argument('--removals',
+                            action='store_true',
+                            help='Also drop removals.  Only once every consumer has read past --through.')
+
     # Database Lock Status
     op_status = sub_parser.add_parser('locks',
                                       help='Show the locks associated with each process.')
@@ -226,6 +245,55 @@ def create_tables(db_link):
     except Exception as error:
         _logger.error("Could not create table: {}\r".format(error))
 
+    # Create change log table.
+    sql = '''CREATE TABLE IF NOT EXISTS changelog (
+            seq             bigserial,
+            entrytime       timestamptz     default current_timestamp,
+            address         cidr,
+            source          varchar(16),
+            action          varchar(8),
+            score           real,
+            PRIMARY KEY (seq),
+            CONSTRAINT fk_source
+                FOREIGN KEY (source)
+                    REFERENCES processes(processname)
+        )'''
+    try:
+        db.execute(sql)
+        db.execute("CREATE INDEX IF NOT EXISTS changelog_key ON changelog (address, source, seq)")
+        print("Created table: changelog")
+    except Exception as error:
+        _logger.error("Could not create table: {}\r".format(error))
+
+    # Create change log floor table.
+    sql = '''CREATE TABLE IF NOT EXISTS changelogfloor (
+            seq             bigint,
+            updated         timestamptz     default current_timestamp
+        )'''
+    try:
+        db.execute(sql)
+        print("Created table: changelogfloor")
+    except Exception as error:
+        _logger.error("Could not create table: {}\r".format(error))
+
+    # Create router checkpoint table.
+    sql = '''CREATE TABLE IF NOT EXISTS checkpoints (
+            processname     varchar(16),
+            generation      varchar(64),
+            acknowledged    int,
+            total           int,
+            updated         timestamptz     default current_timestamp,
+            PRIMARY KEY (processname),
+            CONSTRAINT fk_process
+                FOREIGN KEY (processname)
+                    REFERENCES processes(processname)
+        )'''
+    try:
+        db.execute(sql)
+        print("Created table: checkpoints")
+    except Exception as error:
+        _logger.error("Could not create table: {}\r".format(error))
+
     # Close query cursor
     db.close()
 
@@ -263,6 +331,27 @@ def flush_tables(db_link):
     except Exception as error:
         _logger.error("Could not purge table: {}\r".format(error))
 
+    # Flush Change Log
+    try:
+        db.execute("DELETE FROM changelog")
+        print("Purged table: changelog")
+    except Exception as error:
+        _logger.error("Could not purge table: {}\r".format(error))
+
+    # Flush Change Log Floor
+    try:
+        db.execute("DELETE FROM changelogfloor")
+        print("Purged table: changelogfloor")
+    except Exception as error:
+        _logger.error("Could not purge table: {}\r".format(error))
+
+    # Flush Checkpoints
+    try:
+        db.execute("DELETE FROM checkpoints")
+        print("Purged table: checkpoints")
+    except Exception as error:
+        _logger.error("Could not purge table: {}\r".format(error))
+
     # Flush Processes
     try:
         db.execute("DELETE FROM processes")
@@ -392,6 +481,17 @@ if __name__ == "__main__":
     elif vars(args)['operation'] == 'init':
         print("Creating all tables...")
         create_tables(db_link)
+    elif vars(args)['operation'] == 'upgrade':
+        print("Creating missing tables...")
+        create_tables(db_link)
+    elif vars(args)['operation'] == 'compact':
+        print("Compacting the change log...")
+        removed, through = changelog_compact(db_link, vars(args)['through'], vars(args)['removals'])
+        if vars(args)['removals']:
+            print("Removed {} superseded changes and removals through sequence {}.".format(removed, through))
+            print("Consumers behind sequence {} must start again from 0.".format(through))
+        else:
+            print("Removed {} superseded changes through sequence {}.".format(removed, through))
     elif vars(args)['operation'] == 'status':
         print("Current Lock Status...")
         lock_status(db_link)
@@ -1,16 +1,24 @@
 #!/usr/bin/env python3
 
 from globals import *
+from changelog import CHANGELOG_LOCK, changelog_last
+from exclusions import ExclusionMatcher
+from prefixset import PrefixSet, parse_v4_lines, prefix_to_int
+from statements import StatementConnection, execute_prepared, execute_prepared_batch, statement_stats
 
 # Internal Imports
 import argparse
+import concurrent.futures
 import csv
 import datetime
+import hashlib
 import io
 import ipaddress
+import itertools
+import json
 import logging
+import multiprocessing
 import os
-import re
 import ssl
 import time
 
@@ -19,10 +27,33 @@ import certifi
 import iupy
 import psycopg2
 import tqdm
+import urllib.error
 import urllib.request
 import yaml
 import yaml.scanner
 
+# Hot statements shared by the single and batched helpers.
+BLOCKLIST_ADD_SQL = "INSERT INTO blocklist (address, source, score) VALUES ($1, $2, $3) " \
+                    "ON CONFLICT (address, source) DO UPDATE SET lastadd = current_timestamp, score = EXCLUDED.score"
+
+HISTORY_ADD_SQL = "INSERT INTO history (address, source, action, entry) VALUES ($1, $2, $3, $4)"
+
+# Change log entries are staged on the connection, and only given sequence numbers by db_changelog_flush.
+CHANGELOG_STAGE_SQL = "CREATE TEMP TABLE IF NOT EXISTS lr_changes (ord bigserial, address cidr, source text, " \
+                      "action text, score real)"
+
+CHANGELOG_BATCH_SQL = "INSERT INTO lr_changes (address, source, action, score)" \
+                      " SELECT c.address, %(source)s, %(action)s, c.score" \
+                      " FROM unnest(%(addresses)s::cidr[], %(scores)s::real[]) AS c(address, score)"
+
+CHANGELOG_FLUSH_SQL = "WITH lock AS (SELECT pg_advisory_xact_lock(%(lock)s)), pending AS (" \
+                      " DELETE FROM lr_changes RETURNING ord, address, source, action, score" \
+                      ") INSERT INTO changelog (address, source, action, score)" \
+                      " SELECT p.address, p.source, p.action, p.score FROM lock, pending p ORDER BY p.ord"
+
+NETLIST_ACTIVE_SQL = "INSERT INTO netlist (address, isactive) VALUES ($1, TRUE) " \
+                     "ON CONFLICT (address) DO UPDATE SET lastadd = current_timestamp, isactive = TRUE"
+
 
 def cli_args():
     """
@@ -41,6 +72,28 @@ def cli_args():
     cli_parser.add_argument('--skip-write',
                             action='store_true',
                             help="Look through the lists and changes, but do not commit to the database.")
+    cli_parser.add_argument('--bulk',
+                            action='store_true',
+                            help="Reconcile each list with set-based statements in a single transaction.")
+    cli_parser.add_argument('--force',
+                            action='store_true',
+                            help="Apply lists even when their feed content has not changed since the last run.")
+    cli_parser.add_argument('--no-prepare',
+                            action='store_true',
+                            help="Run statements as plain queries rather than server-side prepared statements.")
+    cli_parser.add_argument('--transaction',
+                            action='store_true',
+                            help="Apply each list in a single transaction.")
+    cli_parser.add_argument('--chunk',
+                            action='store',
+                            type=int,
+                            default=None,
+                            help="Apply each list in a transaction, committing every this many changes.")
+    cli_parser.add_argument('--workers',
+                            action='store',
+                            type=int,
+                            default=1,
+                            help="Apply this many lists at once, each on its own database connection.")
     cli_parser.add_argument('--list',
                             action='store',
                             default='ALL',
@@ -95,6 +148,37 @@ def load_config(config_file):
     return True
 
 
+def db_connect(prepare=True):
+    """
+    This function opens a new autocommit connection to the database.
+
+    :param prepare: Run the hot statements as server-side prepared statements.
+    :return: Database connection, or None if it could not be opened.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_connect")
+
+    try:
+        db_link = psycopg2.connect(host=config['database']['dbHost'],
+                                   port=config['database']['dbPort'],
+                                   database=config['database']['dbName'],
+                                   user=config['database']['dbUserName'],
+                                   password=config['database']['dbUserPass'],
+                                   connection_factory=StatementConnection)
+        db_link.autocommit = True
+        db_link.prepare = prepare
+
+        db = db_link.cursor()
+        db.execute(CHANGELOG_STAGE_SQL)
+        db.close()
+
+        log.debug("Database {} open".format(config['database']['dbName']))
+    except Exception as error:
+        log.error("Could not open database: {}".format(error))
+        return None
+
+    return db_link
+
+
 def db_proc_check(db_link, ident):
     """
     This function checks the current status of a process and returns it.
@@ -108,9 +192,9 @@ def db_proc_check(db_link, ident):
     db = db_link.cursor()
 
     log.debug("Checking for {} process.".format(ident))
-    sql = "SELECT * from processes WHERE processname = 'LR-{}' LIMIT 1".format(ident)
+    sql = "SELECT * from processes WHERE processname = $1 LIMIT 1"
 
-    db.execute(sql)
+    execute_prepared(db, "lr_proc_check", sql, ("LR-{}".format(ident),))
 
     status = "UNLOCKED"
 
@@ -123,8 +207,8 @@ def db_proc_check(db_link, ident):
 
     if row is None:
         sql = "INSERT INTO processes (processname, status, runlast, runsuccess, runfailure) VALUES" \
-              "('LR-{}', '{}', current_timestamp, 0, 0)".format(ident, status)
-        db.execute(sql)
+              "($1, $2, current_timestamp, 0, 0)"
+        execute_prepared(db, "lr_proc_insert", sql, ("LR-{}".format(ident), status))
         log.debug("Added LR-{} to process list.".format(ident))
     else:
         status = row[1]
@@ -146,8 +230,8 @@ def db_proc_lock(db_link, ident):
 
     db = db_link.cursor()
 
-    sql = "UPDATE processes SET runlast = current_timestamp, status = 'LOCKED' WHERE processname = 'LR-{}'".format(ident)
-    db.execute(sql)
+    sql = "UPDATE processes SET runlast = current_timestamp, status = 'LOCKED' WHERE processname = $1"
+    execute_prepared(db, "lr_proc_lock", sql, ("LR-{}".format(ident),))
     db.close()
 
     log.debug("Locked LR-{} in database.".format(ident))
@@ -166,18 +250,19 @@ def db_proc_unlock(db_link, ident, success=True):
 
     db = db_link.cursor()
 
-    sql = "UPDATE processes SET runlast = current_timestamp, status = 'UNLOCKED' WHERE processname = 'LR-{}'".format(ident)
-    db.execute(sql)
+    sql = "UPDATE processes SET runlast = current_timestamp, status = 'UNLOCKED' WHERE processname = $1"
+    execute_prepared(db, "lr_proc_unlock", sql, ("LR-{}".format(ident),))
     log.debug("Unlocked LR-{} in database.".format(ident))
 
     if success:
-        sql = "UPDATE processes set runsuccess = runsuccess + 1 WHERE processname = 'LR-{}'".format(ident)
+        sql = "UPDATE processes set runsuccess = runsuccess + 1 WHERE processname = $1"
+        execute_prepared(db, "lr_proc_success", sql, ("LR-{}".format(ident),))
         log.debug("Incremented success counter.")
     else:
-        sql = "UPDATE processes set runfailure = runfailure + 1 WHERE processname = 'LR-{}'".format(ident)
+        sql = "UPDATE processes set runfailure = runfailure + 1 WHERE processname = $1"
+        execute_prepared(db, "lr_proc_failure", sql, ("LR-{}".format(ident),))
         log.debug("Incremented failure counter.")
 
-    db.execute(sql)
     db.close()
 
 
@@ -195,14 +280,15 @@ def db_netlist(db_link, addr_mask, status):
     db = db_link.cursor()
 
     if status == "ACTIVE":
-        sql = "INSERT INTO netlist (address, isactive) VALUES ('{}', TRUE) " \
-              "ON CONFLICT (address) DO UPDATE SET lastadd = current_timestamp, isactive = TRUE".format(addr_mask)
+        name = "lr_netlist_active"
+        sql = NETLIST_ACTIVE_SQL
     else:
-        sql = "INSERT INTO netlist (address, isactive) VALUES ('{}', FALSE) " \
-              "ON CONFLICT (address) DO UPDATE SET lastadd = current_timestamp, isactive = FALSE".format(addr_mask)
+        name = "lr_netlist_inactive"
+        sql = "INSERT INTO netlist (address, isactive) VALUES ($1, FALSE) " \
+              "ON CONFLICT (address) DO UPDATE SET lastadd = current_timestamp, isactive = FALSE"
 
     try:
-        db.execute(sql)
+        execute_prepared(db, name, sql, (addr_mask,))
         log.debug("Hostlist Entry: {} / {}".format(addr_mask, status))
     except Exception as error:
         log.error("Hostlist Entry Failed: {}".format(error))
@@ -224,12 +310,8 @@ def db_blocklist_add(db_link, ident, addr_mask, score):
 
     db = db_link.cursor()
 
-    sql = "INSERT INTO blocklist (address, source, score) VALUES ('{}', 'LR-{}', '{}')" \
-          "ON CONFLICT (address, source) DO UPDATE SET lastadd = current_timestamp, " \
-          "score = '{}'".format(addr_mask, ident, float(score), float(score))
-
     try:
-        db.execute(sql)
+        execute_prepared(db, "lr_blocklist_add", BLOCKLIST_ADD_SQL, (addr_mask, "LR-{}".format(ident), float(score)))
         log.debug("Blocklist Add: {}-{} ({})".format(ident, addr_mask, score))
     except Exception as error:
         log.error("Blocklist Add Failed: {}".format(error))
@@ -250,10 +332,10 @@ def db_blocklist_delete(db_link, ident, addr_mask):
 
     db = db_link.cursor()
 
-    sql = "DELETE FROM blocklist WHERE address = '{}' AND source = 'LR-{}'".format(addr_mask, ident)
+    sql = "DELETE FROM blocklist WHERE address = $1 AND source = $2"
 
     try:
-        db.execute(sql)
+        execute_prepared(db, "lr_blocklist_delete", sql, (addr_mask, "LR-{}".format(ident)))
         log.debug("Blocklist Remove: {}-{}".format(ident, addr_mask))
     except Exception as error:
         log.error("Blocklist Remove Failed: {}".format(error))
@@ -263,31 +345,34 @@ def db_blocklist_delete(db_link, ident, addr_mask):
 
 def db_blocklist_select(db_link, ident):
     """
-    This function select and returns the value of a block list based on the source where the IP address is the key and
-    the score is the value.
+    This function select and returns the value of a block list based on the source as a prefix set, where each address
+    carries its score.  Only IPv4 is supported, so any IPv6 addresses are returned apart, to be removed.
 
     :param db_link:
     :param ident:
-    :return:
+    :return: Tuple of the block list, and a list of its IPv6 addresses.
     """
     log = logging.getLogger("rtbh-listrunner/db_blocklist_select")
 
     db = db_link.cursor()
-    block_list = {}
+    block_list = PrefixSet()
 
-    sql = "SELECT address, score FROM blocklist WHERE source = 'LR-{}'".format(ident)
-    db.execute(sql)
+    sql = "SELECT address, score FROM blocklist WHERE source = %s"
+    db.execute(sql, ("LR-{}".format(ident),))
 
     log.debug("Loading blocklist attributed to {}".format(ident))
 
+    unsupported = []
+
     for row in db:
-        block_list.update({row[0]: row[1]})
+        if not block_list.add(row[0], row[1]):
+            unsupported.append(row[0])
 
     db.close()
 
     log.debug("Blocklist length for {}: {}".format(ident, len(block_list)))
 
-    return block_list
+    return block_list, unsupported
 
 
 def db_blocklist_count(db_link, addr_mask):
@@ -303,16 +388,220 @@ def db_blocklist_count(db_link, addr_mask):
 
     db = db_link.cursor()
 
-    sql = "SELECT COUNT (*) FROM blocklist WHERE address = '{}';".format(addr_mask)
-    db.execute(sql)
+    sql = "SELECT COUNT (*) FROM blocklist WHERE address = $1"
+    execute_prepared(db, "lr_blocklist_count", sql, (addr_mask,))
 
     count = db.fetchone()[0]
 
+    db.close()
+
     log.debug("Entry count: {}".format(count))
 
     return count
 
 
+def db_blocklist_write_batch(db_link, ident, rows, operation):
+    """
+    This function adds or updates a batch of address records in the block list of a given identity, along with their
+    history, and stages their change log entries.  New addresses are also marked active in the netlist.
+
+    :param db_link:
+    :param ident:
+    :param rows: List of (address, score, history note) tuples.
+    :param operation: ADD or UPDATE
+    :return: Tuple of the number of addresses written, and zero netlist deactivations.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_blocklist_write_batch")
+
+    if len(rows) == 0:
+        return 0, 0
+
+    source = "LR-{}".format(ident)
+
+    db = db_link.cursor()
+
+    # Errors are left to the caller, which knows whether the batch is part of a larger transaction.
+    try:
+        # Netlist rows are shared between lists, so they are always locked in address order.
+        if operation == "ADD":
+            execute_prepared_batch(db, "lr_netlist_active", NETLIST_ACTIVE_SQL,
+                                   [(row[0],) for row in sorted(rows, key=lambda row: prefix_to_int(row[0]))])
+        execute_prepared_batch(db, "lr_blocklist_add", BLOCKLIST_ADD_SQL,
+                               [(row[0], source, float(row[1])) for row in rows])
+        execute_prepared_batch(db, "lr_history_add", HISTORY_ADD_SQL,
+                               [(row[0], source, operation, row[2]) for row in rows])
+        db.execute(CHANGELOG_BATCH_SQL, {'source': source, 'action': operation,
+                                         'addresses': [row[0] for row in rows],
+                                         'scores': [float(row[1]) for row in rows]})
+        log.debug("Blocklist {}: {} entries for {}.".format(operation, len(rows), ident))
+    finally:
+        db.close()
+
+    return len(rows), 0
+
+
+def db_blocklist_remove(db_link, ident, addr_masks):
+    """
+    This function removes a batch of address records from the block list of a given identity.  The history entries are
+    written, the change log entries are staged, and any address which is no longer on another list is marked inactive
+    in the netlist, all in a single statement.
+
+    :param db_link:
+    :param ident:
+    :param addr_masks: List of addresses to remove.
+    :return: Tuple of the number of addresses removed from this list, and the number deactivated in the netlist.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_blocklist_remove")
+
+    if len(addr_masks) == 0:
+        return 0, 0
+
+    db = db_link.cursor()
+
+    # The statement works from a single snapshot, so only rows from other sources keep an address active.
+    sql = "WITH removed AS (" \
+          " DELETE FROM blocklist WHERE source = %(source)s AND address = ANY(%(addresses)s::cidr[])" \
+          " RETURNING address" \
+          "), logged AS (" \
+          " INSERT INTO history (address, source, action, entry)" \
+          " SELECT address, %(source)s, 'DELETE', 'source=' || %(ident)s || ', action=DELETE, host=' ||" \
+          " address::text FROM removed" \
+          "), changed AS (" \
+          " INSERT INTO lr_changes (address, source, action)" \
+          " SELECT address, %(source)s, 'DELETE' FROM removed" \
+          "), deactivated AS (" \
+          " UPDATE netlist n SET lastadd = current_timestamp, isactive = FALSE FROM removed r" \
+          " WHERE n.address = r.address" \
+          " AND NOT EXISTS (SELECT 1 FROM blocklist b WHERE b.address = n.address AND b.source <> %(source)s)" \
+          " RETURNING n.address" \
+          ") SELECT (SELECT COUNT(*) FROM removed), (SELECT COUNT(*) FROM deactivated)"
+
+    # Errors are left to the caller, which knows whether the batch is part of a larger transaction.
+    try:
+        db.execute(sql, {'source': "LR-{}".format(ident), 'ident': ident, 'addresses': list(addr_masks)})
+        counter_delete, counter_inactive = db.fetchone()
+        log.debug("Blocklist Remove: {} removed from {}, {} now inactive.".format(counter_delete, ident,
+                                                                                 counter_inactive))
+    finally:
+        db.close()
+
+    return counter_delete, counter_inactive
+
+
+def db_blocklist_apply(db_link, ident, rows, operation):
+    """
+    This function applies a batch of list changes.  On an autocommit connection a failed batch is logged and skipped.
+    Inside a transaction the batch runs under a savepoint, and if it fails it is retried one row at a time under a
+    savepoint of its own, so a bad row is skipped without losing the rest of the batch or the transaction.  Skipped
+    rows are counted, so the caller can keep the list from being taken as applied.
+
+    :param db_link:
+    :param ident:
+    :param rows: Address rows, as taken by db_blocklist_write_batch, or addresses for a DELETE.
+    :param operation: ADD, UPDATE or DELETE
+    :return: Tuple of the number of addresses applied, the number deactivated in the netlist, and the number skipped.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_blocklist_apply")
+
+    if operation == "DELETE":
+        def apply(batch):
+            return db_blocklist_remove(db_link, ident, batch)
+    else:
+        def apply(batch):
+            return db_blocklist_write_batch(db_link, ident, batch, operation)
+
+    if len(rows) == 0:
+        return 0, 0, 0
+
+    if db_link.autocommit:
+        try:
+            counter_applied, counter_inactive = apply(rows)
+            db_changelog_flush(db_link)
+            return counter_applied, counter_inactive, 0
+        except Exception as error:
+            log.error("Blocklist {} batch failed: {}".format(operation, error))
+            return 0, 0, len(rows)
+
+    db = db_link.cursor()
+
+    db.execute("SAVEPOINT lr_batch")
+    try:
+        counter_applied, counter_inactive = apply(rows)
+        db.execute("RELEASE SAVEPOINT lr_batch")
+        db.close()
+        return counter_applied, counter_inactive, 0
+    except psycopg2.Error as error:
+        db.execute("ROLLBACK TO SAVEPOINT lr_batch")
+        log.error("Blocklist {} batch failed, retrying by row: {}".format(operation, error))
+
+    counter_applied = 0
+    counter_inactive = 0
+    counter_failed = 0
+
+    for row in rows:
+        db.execute("SAVEPOINT lr_row")
+        try:
+            row_applied, row_inactive = apply([row])
+            db.execute("RELEASE SAVEPOINT lr_row")
+            counter_applied += row_applied
+            counter_inactive += row_inactive
+        except psycopg2.Error as error:
+            db.execute("ROLLBACK TO SAVEPOINT lr_row")
+            counter_failed += 1
+            log.error("Blocklist {} skipped {}: {}".format(operation, row if operation == "DELETE" else row[0],
+                                                           error))
+
+    db.close()
+
+    return counter_applied, counter_inactive, counter_failed
+
+
+def db_chunk_commit(db_link, pending, chunk):
+    """
+    This function commits a transactional list apply once a chunk's worth of changes is pending.
+
+    :param db_link:
+    :param pending: Number of changes written since the last commit.
+    :param chunk: Changes per commit.  Zero or None leaves the commit to the end of the list.
+    :return: Number of changes still pending.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_chunk_commit")
+
+    if db_link.autocommit or not chunk or pending < chunk:
+        return pending
+
+    db_changelog_flush(db_link)
+    db_link.commit()
+    log.debug("Committed {} changes.".format(pending))
+
+    return 0
+
+
+def db_changelog_flush(db_link):
+    """
+    This function moves the staged change log entries into the change log, in the order they were staged.
+
+    Sequence numbers are handed out under an advisory lock, which is held until the transaction ends.  It is the last
+    lock a list apply takes, so it is always called just before a commit, and the lock is never held while waiting on
+    a row another list has locked.
+
+    :param db_link:
+    :return: Number of change log entries written.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_changelog_flush")
+
+    db = db_link.cursor()
+
+    try:
+        db.execute(CHANGELOG_FLUSH_SQL, {'lock': CHANGELOG_LOCK})
+        count = db.rowcount
+        log.debug("Change log entries written: {}".format(count))
+    finally:
+        db.close()
+
+    return count
+
+
 def db_history_add(db_link, ident, addr_mask, operation, notes):
     """
     This function adds an entry to the history table.  Ideally, this should be used for any adds or deletes to a
@@ -329,11 +618,8 @@ def db_history_add(db_link, ident, addr_mask, operation, notes):
 
     db = db_link.cursor()
 
-    sql = "INSERT INTO history (address, source, action, entry) VALUES ('{}', 'LR-{}', '{}', '{}')". \
-        format(addr_mask, ident, operation, notes)
-
     try:
-        db.execute(sql)
+        execute_prepared(db, "lr_history_add", HISTORY_ADD_SQL, (addr_mask, "LR-{}".format(ident), operation, notes))
         log.debug("Added History Log: {}".format(notes))
     except Exception as error:
         log.error("Unable to add history: {}".format(error))
@@ -341,78 +627,325 @@ def db_history_add(db_link, ident, addr_mask, operation, notes):
     db.close()
 
 
+def db_netlist_sync(db_link, sources, since):
+    """
+    This function brings the netlist active flag in line with the block list, so that an address is active exactly when
+    at least one list holds it.  This settles any races between lists that were applied at the same time.  Only the
+    addresses those lists changed are checked.
+
+    :param db_link:
+    :param sources: List of the sources which were applied.
+    :param since: Last change log sequence number from before they were applied.
+    :return: Number of netlist entries corrected.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_netlist_sync")
+
+    db = db_link.cursor()
+
+    sql = "UPDATE netlist n SET isactive = EXISTS (SELECT 1 FROM blocklist b WHERE b.address = n.address) " \
+          "WHERE n.address IN (SELECT address FROM changelog WHERE seq > %(since)s AND source = ANY(%(sources)s)) " \
+          "AND isactive IS DISTINCT FROM EXISTS (SELECT 1 FROM blocklist b WHERE b.address = n.address)"
+
+    try:
+        db.execute(sql, {'since': since, 'sources': list(sources)})
+        count = db.rowcount
+        log.debug("Netlist entries corrected: {}".format(count))
+    except Exception as error:
+        log.error("Netlist sync failed: {}".format(error))
+        count = 0
+
+    db.close()
+
+    return count
+
+
+def db_list_reconcile(db_link, ident, list_set, excluded, score_range=None):
+    """
+    This function reconciles a parsed list against the block list of a given identity in bulk.
+
+    The list is streamed into a temporary staging table with COPY.  The adds, score updates, deletes, netlist changes,
+    history and change log entries are then applied as a handful of set-based statements inside a single transaction.
+
+    :param db_link:
+    :param ident:
+    :param list_set: Parsed list as a PrefixSet of addresses and scores.
+    :param excluded: PrefixSet of addresses from the list which matched an exclusion.
+    :param score_range: Tuple of (lwm, hwm) when score evaluation is enabled, otherwise None.
+    :return: Tuple of add, update, and delete counters.
+    """
+    log = logging.getLogger("rtbh-listrunner/db_list_reconcile")
+
+    source = "LR-{}".format(ident)
+
+    # Build the staging data.  The prefix set only holds valid, normalized networks.
+    stage_data = io.StringIO()
+
+    for list_item, list_score in list_set.items():
+        stage_data.write("{}\t{}\t{}\n".format(list_item, list_score, 't' if list_item in excluded else 'f'))
+
+    stage_data.seek(0)
+    log.debug("Staging {} entries for {}.".format(len(list_set), source))
+
+    if score_range is None:
+        params = {'source': source, 'ident': ident, 'score_eval': False, 'lwm': 0, 'hwm': 0}
+    else:
+        params = {'source': source, 'ident': ident, 'score_eval': True,
+                  'lwm': float(score_range[0]), 'hwm': float(score_range[1])}
+
+    autocommit = db_link.autocommit
+    db_link.autocommit = False
+
+    db = db_link.cursor()
+
+    try:
+        db.execute("CREATE TEMP TABLE lr_stage (address cidr PRIMARY KEY, score real, excluded boolean) "
+                   "ON COMMIT DROP")
+        db.copy_expert("COPY lr_stage (address, score, excluded) FROM STDIN", stage_data)
+        db.execute("ANALYZE lr_stage")
+
+        # Score updates for addresses already blocked by this source.
+        sql = "WITH changed AS (" \
+              " UPDATE blocklist b SET lastadd = current_timestamp, score = s.score FROM lr_stage s" \
+              " WHERE b.source = %(source)s AND b.address = s.address AND %(score_eval)s AND NOT s.excluded" \
+              " AND s.score > %(lwm)s AND s.score <> b.score" \
+              " RETURNING b.address, b.score), logged AS (" \
+              " INSERT INTO lr_changes (address, source, action, score)" \
+              " SELECT address, %(source)s, 'UPDATE', score FROM changed)" \
+              " INSERT INTO history (address, source, action, entry)" \
+              " SELECT address, %(source)s, 'UPDATE', 'source=' || %(ident)s || ', action=UPDATE, host=' ||" \
+              " address::text || ', score=' || score::text FROM changed"
+        db.execute(sql, params)
+        counter_update = db.rowcount
+
+        # New addresses for this source.
+        sql = "CREATE TEMP TABLE lr_added ON COMMIT DROP AS" \
+              " SELECT s.address, s.score FROM lr_stage s" \
+              " WHERE NOT s.excluded AND (NOT %(score_eval)s OR s.score >= %(hwm)s)" \
+              " AND NOT EXISTS (SELECT 1 FROM blocklist b WHERE b.source = %(source)s AND b.address = s.address)"
+        db.execute(sql, params)
+        counter_add = db.rowcount
+
+        # Netlist rows are shared between lists, so they are always locked in address order.
+        sql = "INSERT INTO netlist (address, isactive) SELECT address, TRUE FROM lr_added ORDER BY address " \
+              "ON CONFLICT (address) DO UPDATE SET lastadd = current_timestamp, isactive = TRUE"
+        db.execute(sql)
+
+        sql = "INSERT INTO blocklist (address, source, score) SELECT address, %(source)s, score FROM lr_added " \
+              "ON CONFLICT (address, source) DO UPDATE SET lastadd = current_timestamp, score = EXCLUDED.score"
+        db.execute(sql, params)
+
+        sql = "INSERT INTO history (address, source, action, entry)" \
+              " SELECT address, %(source)s, 'ADD', 'source=' || %(ident)s || ', action=ADD, host=' || address::text ||" \
+              " CASE WHEN score > 0 THEN ', score=' || score::text ELSE '' END FROM lr_added"
+        db.execute(sql, params)
+
+        sql = "INSERT INTO lr_changes (address, source, action, score) SELECT address, %(source)s, 'ADD', score" \
+              " FROM lr_added"
+        db.execute(sql, params)
+
+        # Addresses which have left the list, or have fallen below the low water mark.
+        sql = "CREATE TEMP TABLE lr_removed ON COMMIT DROP AS" \
+              " SELECT b.address FROM blocklist b WHERE b.source = %(source)s" \
+              " AND NOT EXISTS (SELECT 1 FROM lr_stage s WHERE s.address = b.address" \
+              " AND (s.excluded OR NOT %(score_eval)s OR s.score >= %(lwm)s))"
+        db.execute(sql, params)
+
+        sql = "DELETE FROM blocklist b USING lr_removed r WHERE b.source = %(source)s AND b.address = r.address"
+        db.execute(sql, params)
+        counter_delete = db.rowcount
+
+        # Only deactivate a netlist entry once no other list holds the address.
+        sql = "UPDATE netlist n SET lastadd = current_timestamp, isactive = FALSE FROM lr_removed r" \
+              " WHERE n.address = r.address AND NOT EXISTS (SELECT 1 FROM blocklist b WHERE b.address = n.address)"
+        db.execute(sql)
+
+        sql = "INSERT INTO history (address, source, action, entry)" \
+              " SELECT address, %(source)s, 'DELETE', 'source=' || %(ident)s || ', action=DELETE, host=' ||" \
+              " address::text FROM lr_removed"
+        db.execute(sql, params)
+
+        sql = "INSERT INTO lr_changes (address, source, action) SELECT address, %(source)s, 'DELETE' FROM lr_removed"
+        db.execute(sql, params)
+
+        # Change log sequence numbers are handed out in commit order.
+        db_changelog_flush(db_link)
+        db_link.commit()
+        log.debug("Reconciled {}: {} added, {} updated, {} deleted.".format(source, counter_add, counter_update,
+                                                                           counter_delete))
+    except Exception as error:
+        log.error("Bulk reconciliation failed for {}: {}".format(source, error))
+        db_link.rollback()
+        counter_add, counter_update, counter_delete = None, None, None
+    finally:
+        db.close()
+        db_link.autocommit = autocommit
+
+    return counter_add, counter_update, counter_delete
+
+
 def process_content_v4hostmask(content):
     """
-    Process raw text contatining v4 hosts w/ bitmasks.  Return a host list.
+    Process lines of text contatining v4 hosts w/ bitmasks.  Return a host list.
 
-    :param content:
+    :param content: Iterable of lines.
     :return:
     """
     log = logging.getLogger("rtbh-listrunner/process_content_v4hostmask")
 
-    # Set up initial variables
-    v4_regex = re.compile('^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\/(3[0-2]|[1-2][0-9]|[0-9])$')
-    line_counter = 0
-    hostmask_dict = dict()
+    hostmask_set, stats = parse_v4_lines(content, masked=True)
 
-    # Split the data into lines
-    content_data = content.splitlines()
+    log.debug("Total lines in file: {}".format(stats['lines']))
+    log.debug("Lines accepted: {}, blank: {}, rejected: {} format, {} octet, {} mask".format(
+        stats['accepted'], stats['blank'], stats['format'], stats['octet'], stats['mask']))
 
-    # Let's loop!
-    for line in content_data:
-        if v4_regex.match(line):
-            hostmask_dict.update({line: 0})
-        else:
-            log.debug("Invalid line data: {}: {}".format(line_counter, line))
-        line_counter += 1
-
-    log.debug("Total lines in file: {}".format(line_counter))
-
-    return hostmask_dict
+    return hostmask_set
 
 
 def process_content_v4host(content):
     """
-    Process raw text containing v4 hosts only.  Return a list of hosts.
+    Process lines of text containing v4 hosts only.  Return a list of hosts.
 
-    :param content:
+    :param content: Iterable of lines.
     :return:
     """
     log = logging.getLogger("rtbh-listrunner/process_content_v4host")
 
-    # Set up initial variables
-    v4_regex = re.compile('^((25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)\.){3}(25[0-5]|2[0-4][0-9]|[01]?[0-9][0-9]?)$')
-    line_counter = 0
-    hostmask_dict = dict()
+    hostmask_set, stats = parse_v4_lines(content, masked=False)
+
+    log.debug("Total lines in file: {}".format(stats['lines']))
+    log.debug("Lines accepted: {}, blank: {}, rejected: {} format, {} octet".format(
+        stats['accepted'], stats['blank'], stats['format'], stats['octet']))
+
+    return hostmask_set
+
+
+def csv_row_filter(cat_index=None, cat_op=None, cat_criteria="", score_index=None, score_threshold=0):
+    """
+    This function compiles the category and score checks for a CSV list into a single function, which is handed a row
+    and returns its score if the row is kept, or None if it is not.  A row with a missing or malformed column raises
+    an IndexError or ValueError.
+
+    :param cat_index: Column of the category, or None to skip the category check.
+    :param cat_op: equals, haystack or needle
+    :param cat_criteria:
+    :param score_index: Column of the score, or None to skip the score check.
+    :param score_threshold: Rows must score above this to be kept.
+    :return:
+    """
+    log = logging.getLogger("rtbh-listrunner/csv_row_filter")
+
+    criteria = str(cat_criteria)
+    threshold = float(score_threshold)
+    category = None
+
+    if cat_index is not None:
+        # Category from the row is equal to the specified criteria.
+        if cat_op == "equals":
+            def category(value):
+                return value == criteria
+
+        # Configured criteria is the haystack, which the row category must be found in.
+        elif cat_op == "haystack":
+            def category(value):
+                return value in criteria
 
-    # Split the data into lines
-    content_data = content.splitlines()
+        # Configured criteria is the needle, found as part of the row category.
+        elif cat_op == "needle":
+            def category(value):
+                return criteria in value
 
-    # Let's loop!
-    for line in content_data:
-        host_mask = "{}/32".format(line)
-        if v4_regex.match(line):
-            hostmask_dict.update({host_mask: 0})
         else:
-            log.debug("Invalid line data: {}: {}".format(line_counter, line))
-        line_counter += 1
+            log.debug("Unknown category operation: {}".format(cat_op))
+
+    def row_filter(row):
+        if category is not None and not category(row[cat_index]):
+            return None
+
+        if score_index is None:
+            return 0
+
+        score = float(row[score_index])
+        if not score > threshold:
+            return None
+
+        return score
+
+    return row_filter
+
+
+def csv_parse_rows(rows, spec):
+    """
+    This function runs CSV rows through the compiled filter and converts the addresses which are kept.
+
+    :param rows: Iterable of rows, as lists of column values.
+    :param spec: Tuple of the address column, and the csv_row_filter arguments.
+    :return: Tuple of packed prefix keys, their scores, the number of invalid rows, and the number of IPv6 rows.
+    """
+    addr_index = spec[0]
+    row_filter = csv_row_filter(*spec[1:])
+
+    keys = []
+    scores = []
+    invalid = 0
+    ipv6 = 0
+
+    for row in rows:
+        if not row:
+            continue
+
+        try:
+            score = row_filter(row)
+            if score is None:
+                continue
+            key = prefix_to_int(row[addr_index])
+        except (IndexError, ValueError):
+            invalid += 1
+            continue
+
+        if key is None:
+            invalid += 1
+            continue
 
-    log.debug("Total lines in file: {}".format(line_counter))
+        # Only IPv4 is supported.
+        if key[0] != 4:
+            ipv6 += 1
+            continue
+
+        keys.append((key[1] << 6) | key[2])
+        scores.append(score)
+
+    return keys, scores, invalid, ipv6
+
+
+def csv_parse_chunk(chunk, spec, skip_space):
+    """
+    This function parses a chunk of CSV lines in a worker process.
 
-    return hostmask_dict
+    :param chunk: List of lines.
+    :param spec: As for csv_parse_rows.
+    :param skip_space: Skip the whitespace following each delimiter.
+    :return: As for csv_parse_rows.
+    """
+    return csv_parse_rows(csv.reader(chunk, skipinitialspace=skip_space), spec)
 
 
-def process_content_csv(content, entry):
+def process_content_csv(content, entry, pool=None):
     """
     This list processes content that's in a CSV format.
 
-    :param content:
+    The configured column names are resolved to indexes once from the header, and the category and score checks are
+    compiled into a single filter.  Large feeds may be split into chunks of lines and parsed by the run's pool of
+    worker processes when csv.workers is set, provided no field spans more than one line.  Without a pool, the feed is
+    parsed here.
+
+    :param content: Iterable of lines.
     :param entry:
+    :param pool: ProcessPoolExecutor shared by every list in the run, or None.
     :return:
     """
     log = logging.getLogger("rtbh-listrunner/process_content_csv")
 
-    hostmask_dict = {}
+    hostmask_set = PrefixSet()
 
     # Default Booleans
     return_empty = True
@@ -450,103 +983,161 @@ def process_content_csv(content, entry):
                     score_threshold = entry['score']['lwm']
 
     if return_empty:
-        log.debug("No address field identified.  Returning empty dictionary.")
-        return hostmask_dict
+        log.debug("No address field identified.  Returning empty set.")
+        return hostmask_set
 
-    # Content is already loaded, but we'll be working the CSV like a file.
-    csv_file = io.StringIO(content)
+    # The CSV reader works straight from the lines as they arrive.  If we have headers defined for a given CSV, we'll
+    # use them, otherwise they come from the first row.
+    lines = iter(content)
+    skip_space = 'headers' not in entry['csv']
 
-    row_counter = 0
+    if 'headers' in entry['csv']:
+        headers = entry['csv']['headers']
+    else:
+        headers = next(csv.reader(itertools.islice(lines, 1), skipinitialspace=True), [])
 
-    with csv_file as csv_read:
+    # Resolve the configured columns to their indexes.
+    try:
+        addr_index = headers.index(csv_addr)
+        cat_index = headers.index(csv_cat) if cat_check else None
+        score_index = headers.index(csv_score) if score_check else None
+    except ValueError as error:
+        log.error("Invalid field specified: {}".format(error))
+        return
 
-        # If we have headers defined for a given CSV, we'll load them.
-        if 'headers' in entry['csv']:
-            csv_data = csv.DictReader(csv_read, fieldnames=entry['csv']['headers'])
-        else:
-            csv_data = csv.DictReader(csv_read, skipinitialspace=True)
-
-        # Process each CSV line.
-        for row in csv_data:
-
-            # Make sure the csv_addr field is in place, and add a host netmask if there is no mask specified.
-            try:
-                if "/" not in row[csv_addr]:
-                    host_addr = "{}/32".format(row[csv_addr])
-                else:
-                    host_addr = row[csv_addr]
-            except KeyError as error:
-                log.error("Invalid field specified: {}".format(error))
-                return
-
-            host_score = 0
-
-            # Category checks will skip to the next item in the loop if the match is proper.
-
-            if cat_check:
-                # Category from the row is equal to the specified criteria.
-                if cat_op == "equals":
-                    if not str(cat_criteria) == str(row[csv_cat]):
-                        continue
-
-                # Configured criteria is the haystack, which the row category must be found in.
-                elif cat_op == "haystack":
-                    if not str(row[csv_cat]) in str(cat_criteria):
-                        continue
-
-                # Configured criteria is the needle, found as part of the row category.
-                elif cat_op == "needle":
-                    if not str(cat_criteria) in str(row[csv_cat]):
-                        continue
-
-                #
-                else:
-                    log.debug("Unknown category operation: {}".format(cat_op))
-
-            if score_check:
-                try:
-                    host_score = row[csv_score]
-                except KeyError as error:
-                    log.error("Invalid score field specified: {}".format(error))
+    spec = (addr_index, cat_index, cat_op, cat_criteria, score_index, score_threshold)
 
-                if not float(row[csv_score]) > float(score_threshold):
-                    continue
+    workers = entry['csv'].get('workers', 1)
+    chunk_size = entry['csv'].get('chunk', 100000)
+
+    if workers > 1 and pool is not None:
+        chunks = iter(lambda: list(itertools.islice(lines, chunk_size)), [])
+
+        keys = []
+        scores = []
+        invalid = 0
+        ipv6 = 0
+
+        for chunk_keys, chunk_scores, chunk_invalid, chunk_ipv6 in pool.map(csv_parse_chunk, chunks,
+                                                                            itertools.repeat(spec),
+                                                                            itertools.repeat(skip_space)):
+            keys.extend(chunk_keys)
+            scores.extend(chunk_scores)
+            invalid += chunk_invalid
+            ipv6 += chunk_ipv6
+    else:
+        keys, scores, invalid, ipv6 = csv_parse_rows(csv.reader(lines, skipinitialspace=skip_space), spec)
 
-            # log.debug("CSV Row: {} / {} / {}".format(host_addr, host_score, row[csv_cat]))
-            hostmask_dict.update({host_addr: host_score})
-            row_counter +=1;
+    hostmask_set = PrefixSet.from_keys(keys, values=scores)
+    hostmask_set.invalid = invalid
+    hostmask_set.ipv6 = ipv6
 
-    log.debug("CSV Rows Adopted: {}".format(row_counter))
+    log.debug("CSV Rows Adopted: {}".format(len(keys)))
+    log.debug("CSV Rows Invalid: {}".format(invalid))
 
-    return hostmask_dict
+    if ipv6 > 0:
+        log.warning("CSV Rows Ignored: {} IPv6 addresses.  Only IPv4 is supported.".format(ipv6))
 
+    return hostmask_set
 
-def get_by_file(file_name):
+
+def get_by_file(file_name, content_hash=None):
     """
-    This function just opens and reads the data from a file.
+    This function opens a file and yields its lines one at a time, without line endings.
 
     :param file_name:
+    :param content_hash: Optional hashlib object which is updated with the raw file content.
     :return:
     """
     log = logging.getLogger("rtbh-listrunner/get_by_file")
 
     try:
-        file = open(file_name, "r")
-        file_content = file.read()
-        file.close()
-        log.debug("Successfully loaded {}.".format(file_name))
+        file = open(file_name, "rb")
     except Exception as error:
         log.error("Unable to read {}: {}".format(file_name, error))
-        file_content = ""
+        return
 
-    return(file_content)
+    with file:
+        log.debug("Streaming {}.".format(file_name))
+        for raw_line in file:
+            if content_hash is not None:
+                content_hash.update(raw_line)
+            yield raw_line.decode(errors="replace").rstrip('\r\n')
 
 
-def get_by_url(entry):
+def cache_meta_load(meta_file):
+    """
+    This function loads the metadata kept alongside a cache file.
+
+    :param meta_file:
+    :return: Dictionary, which is empty if there is no usable metadata.
     """
-    This function returns raw data from a URL, or its cached file if the file is within expiry.
+    log = logging.getLogger("rtbh-listrunner/cache_meta_load")
+
+    try:
+        with open(meta_file, "r") as file:
+            meta = json.load(file)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as error:
+        log.error("Unable to read cache metadata {}: {}".format(meta_file, error))
+        return {}
+
+    if not isinstance(meta, dict):
+        return {}
+
+    return meta
+
+
+def cache_meta_save(meta_file, meta):
+    """
+    This function saves the metadata kept alongside a cache file.
+
+    :param meta_file:
+    :param meta:
+    :return:
+    """
+    log = logging.getLogger("rtbh-listrunner/cache_meta_save")
+
+    try:
+        with open("{}.tmp".format(meta_file), "w") as file:
+            json.dump(meta, file)
+        os.replace("{}.tmp".format(meta_file), meta_file)
+    except OSError as error:
+        log.error("Unable to write cache metadata {}: {}".format(meta_file, error))
+
+
+def cache_meta_applied(feed_state):
+    """
+    This function records that the content of a feed has been applied to the database.
+
+    :param feed_state: State dictionary filled in by get_by_url.
+    :return:
+    """
+    if 'meta_file' not in feed_state or 'hash' not in feed_state:
+        return
+
+    meta = cache_meta_load(feed_state['meta_file'])
+    meta['applied'] = feed_state['hash']
+    cache_meta_save(feed_state['meta_file'], meta)
+
+
+def get_by_url(entry, feed_state=None, timeout=None, force=False):
+    """
+    This function yields the lines of a URL, or its cached file if the file is within expiry.
+
+    Lines are parsed as they arrive from the server, and the raw bytes are written to the cache file as they go.  The
+    cache file is only put in place once the whole list has been received.
+
+    A metadata file is kept next to each cache file with the ETag, Last-Modified and content hash of the last download,
+    along with the hash of the content last applied to the database.  Expired caches are refreshed with a conditional
+    request.  If the server reports the list is not modified and it has already been applied, nothing is yielded and
+    the feed state is marked as unchanged, unless the list is being forced, in which case the cached file is read.
 
     :param entry:
+    :param feed_state: Optional dictionary which receives the content hash, metadata file and unchanged flag.
+    :param timeout: Optional number of seconds allowed for the whole download.
+    :param force: Yield the content even if it has already been applied.
     :return:
     """
     global config
@@ -583,6 +1174,14 @@ def get_by_url(entry):
 
     log.debug("Cache file is {}".format(cache_file))
 
+    if feed_state is None:
+        feed_state = {}
+
+    meta_file = "{}.json".format(os.path.splitext(cache_file)[0])
+    meta = cache_meta_load(meta_file)
+    feed_state['meta_file'] = meta_file
+    feed_state['unchanged'] = False
+
     # Assume we need to get the file.
     get_file = True
 
@@ -598,46 +1197,241 @@ def get_by_url(entry):
     else:
         log.debug("Cache file not found.")
 
-    # Get the text data from the URL and save it locally.
+    # A conditional request tells us whether the cached copy is still current.
+    url_request = urllib.request.Request(entry['url'])
+    if get_file is True and os.path.isfile(cache_file):
+        if 'etag' in meta:
+            url_request.add_header('If-None-Match', meta['etag'])
+        if 'last_modified' in meta:
+            url_request.add_header('If-Modified-Since', meta['last_modified'])
+
+    url_response = None
+
     if get_file is True:
         log.debug("Acquiring file for {}.".format(entry['ident']))
+        ssl_context = ssl.create_default_context(cafile=certifi.where())
+        try:
+            url_response = urllib.request.urlopen(url_request, context=ssl_context, timeout=timeout)
+        except urllib.error.HTTPError as error:
+            if error.code != 304:
+                raise
+            log.debug("List {} not modified.".format(entry['ident']))
+            os.utime(cache_file)
+
+    # Load in the content by the file, unless it has already been applied.
+    if url_response is None:
+        if not force and 'hash' in meta and meta.get('applied') == meta['hash']:
+            log.debug("Cached content for {} has already been applied.".format(entry['ident']))
+            feed_state['hash'] = meta['hash']
+            feed_state['unchanged'] = True
+            return
+
+        content_hash = hashlib.sha256()
+        yield from get_by_file(cache_file, content_hash)
+        feed_state['hash'] = content_hash.hexdigest()
+        feed_state['unchanged'] = meta.get('applied') == feed_state['hash']
+        return
 
-        raw_data = ""
+    # Stream the text data from the URL and save it locally.
+    cache_temp = "{}.tmp".format(cache_file)
 
-        ssl_context = ssl.create_default_context(cafile=certifi.where())
-        url_response = urllib.request.urlopen(entry['url'], context=ssl_context)
+    try:
+        cache_write = open(cache_temp, "wb")
+    except FileNotFoundError as error:
+        log.error("Unable to write cache: {}".format(error))
+        cache_write = None
+    except PermissionError as error:
+        log.error("No permission to write cache: {}".format(error))
+        cache_write = None
 
-        with url_response as r:
-            raw_data += r.read().decode()
+    content_hash = hashlib.sha256()
+    content_length = 0
+    complete = False
 
-        try:
-            cache_write = open(cache_file, "w")
-            cache_write.write(raw_data)
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+
+    try:
+        with url_response as r:
+            for raw_line in r:
+                if timeout is not None and time.monotonic() > deadline:
+                    raise TimeoutError("Download of {} exceeded {} seconds.".format(entry['ident'], timeout))
+                content_length += len(raw_line)
+                content_hash.update(raw_line)
+                if cache_write is not None:
+                    cache_write.write(raw_line)
+                yield raw_line.decode(errors="replace").rstrip('\r\n')
+        complete = True
+    finally:
+        if cache_write is not None:
             cache_write.close()
-        except FileNotFoundError as error:
-            log.error("Unable to write cache: {}".format(error))
-        except PermissionError as error:
-            log.error("No permission to write cache: {}".format(error))
+            if complete:
+                os.replace(cache_temp, cache_file)
+            else:
+                os.remove(cache_temp)
+
+    log.debug("Content length: {} bytes.".format(content_length))
+
+    feed_state['hash'] = content_hash.hexdigest()
+
+    # A download identical to what has already been applied needs no further work.
+    if meta.get('applied') == feed_state['hash']:
+        log.debug("Downloaded content for {} has already been applied.".format(entry['ident']))
+        feed_state['unchanged'] = True
 
-    # Load in the content by the file.
-    content = get_by_file(cache_file)
-    log.debug("Content length: {} bytes.".format(len(content)))
+    meta['hash'] = feed_state['hash']
+    meta.pop('etag', None)
+    meta.pop('last_modified', None)
+    if url_response.headers.get('ETag'):
+        meta['etag'] = url_response.headers.get('ETag')
+    if url_response.headers.get('Last-Modified'):
+        meta['last_modified'] = url_response.headers.get('Last-Modified')
 
-    return content
+    if cache_write is not None:
+        cache_meta_save(meta_file, meta)
 
 
-def list_processor(db_link, entry):
+def list_summary(ident, size, counter_add, counter_delete, counter_update, counter_excluded, header=False):
+    """
+    This function prints the summary of a processed list in one piece, so that lists processed in parallel don't
+    interleave their output.
+
+    :param ident:
+    :param size:
+    :param counter_add:
+    :param counter_delete:
+    :param counter_update:
+    :param counter_excluded:
+    :param header: Include the list header line.
+    :return:
+    """
+    summary = []
+
+    if header:
+        summary.append("List: {} ({})".format(ident, size))
+
+    summary.append(" Add/Del..: {} / {}".format(counter_add, counter_delete))
+    if counter_update > 0:
+        summary.append(" Updates..: {}".format(counter_update))
+    if counter_excluded > 0:
+        summary.append(" Excluded.: {}".format(counter_excluded))
+
+    print("\n".join(summary))
+
+
+def list_acquire(entry, timeout=None, force=False, pool=None):
+    """
+    This function acquires and parses the list for a given entry.  It does not touch the database.
+
+    :param entry:
+    :param timeout: Optional number of seconds allowed for a URL download.
+    :param force: Parse the list even if its content has already been applied.
+    :param pool: ProcessPoolExecutor for parsing large CSV feeds, or None.
+    :return: Tuple of the parsed PrefixSet and the feed state.  The set is None if the list could not be acquired.
+    """
+    log = logging.getLogger("rtbh-listrunner/list_acquire")
+
+    feed_state = {}
+
+    # Acquire the raw data as a stream of lines, which the parsers consume as it arrives.
+    if 'url' in entry:
+        log.debug("List {} by URL: {}".format(entry['ident'], entry['url']))
+        raw_content = get_by_url(entry, feed_state, timeout, force)
+    elif 'file' in entry:
+        log.debug("List {} by File: {}".format(entry['ident'], entry['file']))
+        raw_content = get_by_file(entry['file'])
+    else:
+        log.error("Entry {} must contain a url or file identifier.".format(entry['ident']))
+        return None, feed_state
+
+    # Acquire the host list based upon its configured type.
+    try:
+        if 'type' in entry:
+            if entry['type'] == 'v4_host':
+                list_set = process_content_v4host(raw_content)
+            elif entry['type'] == 'v4_host_mask':
+                list_set = process_content_v4hostmask(raw_content)
+            elif entry['type'] == 'csv':
+                list_set = process_content_csv(raw_content, entry, pool)
+            else:
+                log.error("Entry type {} unrecognized.".format(entry['type']))
+                return None, feed_state
+        else:
+            log.error("Entry {} must contain a compatible list type.".format(entry['ident']))
+            return None, feed_state
+    except Exception as error:
+        log.error("Unable to acquire list {}: {}".format(entry['ident'], error))
+        return None, feed_state
+
+    return list_set, feed_state
+
+
+def list_acquire_all(entries, workers=4, timeout=None, force=False, pool=None):
+    """
+    This function acquires and parses a number of lists in parallel, ahead of any database work.
+
+    :param entries: List entries to acquire.
+    :param workers: Maximum number of lists acquired at once.
+    :param timeout: Optional number of seconds allowed for each URL download.
+    :param force: Parse every list even if its content has already been applied.
+    :param pool: ProcessPoolExecutor shared by the lists for parsing large CSV feeds, or None.
+    :return: Dictionary of list_acquire results keyed by list identity.
+    """
+    log = logging.getLogger("rtbh-listrunner/list_acquire_all")
+
+    acquired = {}
+
+    if len(entries) == 0:
+        return acquired
+
+    print("Acquiring {} lists, {} at a time.".format(len(entries), workers))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for entry in entries:
+            futures[executor.submit(list_acquire, entry, timeout, force, pool)] = (entry, time.monotonic())
+
+        for future in concurrent.futures.as_completed(futures):
+            entry, started = futures[future]
+            acquired[entry['ident']] = future.result()
+
+            if acquired[entry['ident']][0] is None:
+                print(" {:.<12}: failed".format(entry['ident']))
+            elif acquired[entry['ident']][1].get('unchanged'):
+                print(" {:.<12}: unchanged ({:.1f}s)".format(entry['ident'], time.monotonic() - started))
+            else:
+                print(" {:.<12}: {} entries ({:.1f}s)".format(entry['ident'], len(acquired[entry['ident']][0]),
+                                                                time.monotonic() - started))
+
+    log.debug("Acquired {} lists.".format(len(acquired)))
+    print()
+
+    return acquired
+
+
+def list_processor(db_link, entry, bulk=False, exclusions=None, force=False, acquired=None, progress=True,
+                   chunk=None):
     """
     This function processes a block list for a given entry.
 
     :param db_link:
     :param entry:
+    :param bulk: Reconcile the list with set-based statements rather than per address.
+    :param exclusions: Compiled ExclusionMatcher for the run.
+    :param force: Apply the list even if the feed content has not changed.
+    :param acquired: Result of list_acquire if the list was acquired ahead of time.
+    :param progress: Show progress bars.  Without them, the list summary is printed in one piece once it is done.
+    :param chunk: Apply the list in a transaction, committing every so many changes, or only at the end when zero.
+                  None writes each batch as it goes.
     :return:
     """
     log = logging.getLogger("rtbh-listrunner/list_processor")
 
     list_notes = ''
 
+    # Progress bars are only shown outside of debugging.
+    show_progress = progress and logging.root.level != logging.DEBUG
+
     #
     # List Readiness
     #
@@ -651,39 +1445,40 @@ def list_processor(db_link, entry):
     else:
         db_proc_lock(db_link, entry['ident'])
 
-    # Acquire the raw data.
-    if 'url' in entry:
-        log.debug("List {} by URL: {}".format(entry['ident'], entry['url']))
-        raw_content = get_by_url(entry)
-    elif 'file' in entry:
-        log.debug("List {} by File: {}".format(entry['ident'], entry['file']))
-        raw_content = get_by_file(entry['file'])
-    else:
-        log.error("Entry {} must contain a url or file identifier.")
+    # Use the list acquired ahead of time, or go get it now.
+    if acquired is None:
+        acquired = list_acquire(entry, force=force)
+
+    list_set, feed_state = acquired
+
+    if list_set is None:
+        db_proc_unlock(db_link, entry['ident'], False)
         return
 
-    # Acquire the host list based upon its configured type.
-    if 'type' in entry:
-        if entry['type'] == 'v4_host':
-            list_dict = process_content_v4host(raw_content)
-        elif entry['type'] == 'v4_host_mask':
-            list_dict = process_content_v4hostmask(raw_content)
-        elif entry['type'] == 'csv':
-            list_dict = process_content_csv(raw_content, entry)
-        else:
-            log.error("Entry type {} unrecognized.".format(entry['type']))
-            db_proc_unlock(db_link, entry['ident'], False)
-            return
-    else:
-        log.error("Entry {} must contain a compatible list type.")
+    # Skip the database work entirely when the feed content has already been applied.
+    if feed_state.get('unchanged') and not force:
+        print("List: {} (unchanged)".format(entry['ident']))
+        db_proc_unlock(db_link, entry['ident'], True)
+        return
+
+    # A forced list must have been read in full, or every address on it would be taken as gone.
+    if feed_state.get('unchanged') and len(list_set) == 0:
+        log.error("List {} is unchanged but yielded no entries.  Skipping this run.".format(entry['ident']))
         db_proc_unlock(db_link, entry['ident'], False)
         return
 
-    if len(list_dict) == 0:
-        log.error("List dictionary is blank.  This could be a problem.")
+    if len(list_set) == 0:
+        log.error("List is blank.  This could be a problem.")
+
+    # Filter the whole list against the exclusions in one pass.
+    if exclusions is None:
+        exclusions = ExclusionMatcher.from_config(config['listrunner'].get('exclude'))
 
-    # Get the current block list
-    block_dict = db_blocklist_select(db_link, entry['ident'])
+    list_kept, exclusion_counts = exclusions.filter(list_set)
+    excluded = list_set.difference(list_kept)
+
+    for rule, count in exclusion_counts.items():
+        log.debug("Exclusion {} matched {} entries.".format(rule, count))
 
     # Are we doing any score evaluation with the given list entry?
     score_eval = False
@@ -693,6 +1488,40 @@ def list_processor(db_link, entry):
             score_lwm = entry['score']['lwm']
             score_hwm = entry['score']['hwm']
 
+    # Bulk reconciliation hands the whole list to the database in one go.
+    if bulk:
+        if progress:
+            print("List: {} ({})".format(entry['ident'], len(list_set)))
+
+        if score_eval:
+            counters = db_list_reconcile(db_link, entry['ident'], list_set, excluded, (score_lwm, score_hwm))
+        else:
+            counters = db_list_reconcile(db_link, entry['ident'], list_set, excluded)
+
+        counter_add, counter_update, counter_delete = counters
+
+        if counter_add is None:
+            db_proc_unlock(db_link, entry['ident'], False)
+            return
+
+        db_proc_unlock(db_link, entry['ident'], True)
+        cache_meta_applied(feed_state)
+
+        list_summary(entry['ident'], len(list_set), counter_add, counter_delete, counter_update, len(excluded),
+                     not progress)
+
+        return
+
+    # Get the current block list, and work out what is new, what is already there, and what has gone.
+    block_set, block_unsupported = db_blocklist_select(db_link, entry['ident'])
+
+    add_set = list_kept.difference(block_set)
+    common_set = list_kept.intersection(block_set)
+    remove_set = block_set.difference(list_set)
+
+    # Scored addresses which fall below the low water mark are dropped along with the rest.
+    remove_list = []
+
     log.debug("Running {} List Loop".format(entry['ident']))
 
     #
@@ -700,191 +1529,233 @@ def list_processor(db_link, entry):
     #
 
     # Block/Add Progress Bar
-    if logging.root.level != logging.DEBUG:
-        print("List: {} ({})".format(entry['ident'], len(list_dict)))
-        progress_bar = tqdm.tqdm(total=len(list_dict), desc=' Block/Add')
+    if show_progress:
+        print("List: {} ({})".format(entry['ident'], len(list_set)))
+        progress_bar = tqdm.tqdm(total=len(list_set), desc=' Block/Add')
+        progress_bar.update(len(excluded))
 
     counter_add = 0
     counter_update = 0
     counter_delete = 0
+    counter_inactive = 0
+    counter_failed = 0
 
-    # Loop through the active block dictionary.
-    for list_item in list_dict:
-
-        # Prep for exclusion checks.
-        exclusion_continue = False
-
-        # Check exclusions: Exact List
-        try:
-            if list_item in config['listrunner']['exclude']['exact']:
-                exclusion_continue = True
-        except Exception as error:
-            log.debug("Exception check failed: {}".format(error))
-
-        # Check exclusions: Subnet List
-        try:
-            for within_item in config['listrunner']['exclude']['within']:
-                if ipaddress.ip_network(list_item).subnet_of(ipaddress.ip_network(within_item)):
-                    exclusion_continue = True
-        except Exception as error:
-            log.debug("Exception check failed: {}".format(error))
+    # Changes are written in batches of bound statements.
+    write_rows = []
+    write_batch = 1000
 
-        # If we have an exclusion, skip to the next entry in the loop
-        if exclusion_continue is True:
-            log.debug("Address {} found in exclusion subnets.")
-            if logging.root.level != logging.DEBUG:
-                progress_bar.update(1)
-            continue
+    # A transactional apply holds the list's changes back until they are committed, all at once or in chunks, so an
+    # interrupted run leaves the previous list state in place.
+    if chunk is not None:
+        db_link.autocommit = False
+    counter_pending = 0
 
-        # If an entry is in the block list, evaluate and update.
-        if list_item in block_dict:
+    try:
+        # Loop through the entries which are already blocked.
+        for list_item, list_score in common_set.items():
 
             # Evaluate scores against a configured low watermark (lwn) and high watermark (hwm).
             if score_eval:
 
                 # Evaluate if the item is greater than the low water mark / minimum score.
-                if float(list_dict[list_item]) > float(score_lwm):
-                    log.debug("Address {} already in {} w/ score: {}".format(list_item, entry['ident'],
-                                                                             list_dict[list_item]))
-                    # db_hostlist(db_link, list_item, "ACTIVE")
-                    # db_blocklist_add(db_link, entry['ident'], list_item, list_dict[list_item])
+                if list_score > float(score_lwm):
+                    log.debug("Address {} already in {} w/ score: {}".format(list_item, entry['ident'], list_score))
 
                     # Log if the score has changed.
-                    if not float(list_dict[list_item]) == float(block_dict[list_item]):
-                        log.debug("Score change: {} from {}".format(list_dict[list_item], block_dict[list_item]))
-
-                        # Update blocklist with new score.
-                        db_blocklist_add(db_link, entry['ident'], list_item, list_dict[list_item])
-
-                        # Update the history log entry for the score.
-                        history_string = "source={}, action=UPDATE, host={}, score={}".format(entry['ident'],
-                                                                                              list_item,
-                                                                                              list_dict[list_item])
-                        db_history_add(db_link, entry['ident'], list_item, "UPDATE", history_string)
-
-                        counter_update += 1
+                    if not list_score == block_set[list_item]:
+                        log.debug("Score change: {} from {}".format(list_score, block_set[list_item]))
+
+                        # Queue the blocklist score update and its history log entry.
+                        history_string = "source={}, action=UPDATE, host={}, score={:g}".format(entry['ident'],
+                                                                                                list_item,
+                                                                                                list_score)
+                        write_rows.append((list_item, list_score, history_string))
+
+                        if len(write_rows) >= write_batch:
+                            batch_result = db_blocklist_apply(db_link, entry['ident'], write_rows, "UPDATE")
+                            counter_update += batch_result[0]
+                            counter_failed += batch_result[2]
+                            counter_pending = db_chunk_commit(db_link, counter_pending + len(write_rows), chunk)
+                            write_rows.clear()
 
                 # Remove from the list if the item is now under the low water mark / minimum score.
-                elif float(list_dict[list_item]) < float(score_lwm):
-                    log.debug("Address {} score {} is scored below {}.".format(list_item,
-                                                                               list_dict[list_item],
-                                                                               score_lwm))
+                elif list_score < float(score_lwm):
+                    log.debug("Address {} score {} is scored below {}.".format(list_item, list_score, score_lwm))
 
-                    # Pop from the list and it will be dropped on the cleanup loop.
-                    list_dict.pop(list_item)
+                    # Drop it on the cleanup loop.
+                    remove_list.append(list_item)
 
             # Make a debug note if we're already blocked.
             else:
                 log.debug("Address {} already in {}".format(list_item, entry['ident']))
 
-        # if an entry is not in the block list, add to it.
-        else:
+            # Update the progress bar before finishing out the loop.
+            if show_progress:
+                progress_bar.update(1)
+
+        batch_result = db_blocklist_apply(db_link, entry['ident'], write_rows, "UPDATE")
+        counter_update += batch_result[0]
+        counter_failed += batch_result[2]
+        counter_pending = db_chunk_commit(db_link, counter_pending + len(write_rows), chunk)
+        write_rows.clear()
+
+        # Loop through the entries which are not yet blocked.
+        for list_item, list_score in add_set.items():
             log.debug("Address {} not in {}".format(list_item, entry['ident']))
 
             if score_eval:
                 # Don't add a address if the score is too low.
-                if float(list_dict[list_item]) < float(score_hwm):
-                    log.debug("Address {} score {} is scored below {}.".format(list_item,
-                                                                               list_dict[list_item],
-                                                                               score_hwm))
-                    if logging.root.level != logging.DEBUG:
+                if list_score < float(score_hwm):
+                    log.debug("Address {} score {} is scored below {}.".format(list_item, list_score, score_hwm))
+                    if show_progress:
                         progress_bar.update(1)
                     continue
 
-            # Update the Host List
-            db_netlist(db_link, list_item, "ACTIVE")
-
-            # Update the block list
-            db_blocklist_add(db_link, entry['ident'], list_item, list_dict[list_item])
-
-            # Update our history logs.
+            # Queue the host list, block list and history log updates.
             history_string = "source={}, action=ADD, host={}".format(entry['ident'], list_item)
 
             # Append the score if we have one.
-            if float(list_dict[list_item]) > 0:
-                history_string += ", score={}".format(list_dict[list_item])
+            if list_score > 0:
+                history_string += ", score={:g}".format(list_score)
 
-            db_history_add(db_link, entry['ident'], list_item, "ADD", history_string)
+            write_rows.append((list_item, list_score, history_string))
 
-            # Add to the blocklist dictionary, so it doesn't get deleted in the next check.
-            block_dict.update({list_item: 0})
+            if len(write_rows) >= write_batch:
+                batch_result = db_blocklist_apply(db_link, entry['ident'], write_rows, "ADD")
+                counter_add += batch_result[0]
+                counter_failed += batch_result[2]
+                counter_pending = db_chunk_commit(db_link, counter_pending + len(write_rows), chunk)
+                write_rows.clear()
 
-            counter_add += 1
+            # Update the progress bar before finishing out the loop.
+            if show_progress:
+                progress_bar.update(1)
 
-        # Update the progress bar before finishing out the loop.
-        if logging.root.level != logging.DEBUG:
-            progress_bar.update(1)
+        batch_result = db_blocklist_apply(db_link, entry['ident'], write_rows, "ADD")
+        counter_add += batch_result[0]
+        counter_failed += batch_result[2]
+        counter_pending = db_chunk_commit(db_link, counter_pending + len(write_rows), chunk)
 
-    # Close the progress bar.
-    if logging.root.level != logging.DEBUG:
-        progress_bar.close()
+        # Close the progress bar.
+        if show_progress:
+            progress_bar.close()
 
-    #
-    # Cleanup Loop Begins
-    #
+        #
+        # Cleanup Loop Begins
+        #
 
-    log.debug("Running {} Block Loop".format(entry['ident']))
+        log.debug("Running {} Block Loop".format(entry['ident']))
 
-    # Cleanup Progress Bar
-    if logging.root.level != logging.DEBUG and len(block_dict) > 0:
-        progress_bar = tqdm.tqdm(total=len(block_dict), desc=' Cleanup  ')
+        remove_list.extend(remove_set)
 
-    # Loop block list against current entries.
-    for block_item in block_dict:
+        # Addresses which can't be deployed are removed, as a bulk reconcile would.
+        if len(block_unsupported) > 0:
+            log.warning("Removing {} IPv6 addresses from {}.  Only IPv4 is supported.".format(len(block_unsupported),
+                                                                                             entry['ident']))
+            remove_list.extend(block_unsupported)
 
-        # If the block item is in the current list, there's nothing more to do in this loop.
-        if block_item in list_dict:
-            pass
+        # Cleanup Progress Bar
+        if show_progress and len(remove_list) > 0:
+            progress_bar = tqdm.tqdm(total=len(remove_list), desc=' Cleanup  ')
 
-        # If the block item is *not* in the current list, remove from the block list, and update the hostlist if applicable.
-        else:
-            log.debug("Address {} is not on the {} block list.".format(block_item, entry['ident']))
+        # Remove the block items which are *not* in the current list in batches, and update the hostlist if applicable.
+        remove_batch = 10000
 
-            # Remove from the block list.
-            db_blocklist_delete(db_link, entry['ident'], block_item)
+        for i in range(0, len(remove_list), remove_batch):
+            batch = remove_list[i:i + remove_batch]
 
-            counter_delete += 1
+            batch_delete, batch_inactive, batch_failed = db_blocklist_apply(db_link, entry['ident'], batch, "DELETE")
+            counter_delete += batch_delete
+            counter_inactive += batch_inactive
+            counter_failed += batch_failed
+            counter_pending = db_chunk_commit(db_link, counter_pending + len(batch), chunk)
 
-            # Change the hostlist only if there are no entries in the block list.
-            bl_counter = db_blocklist_count(db_link, block_item)
+            # Update the progress bar before finishing out the loop.
+            if show_progress:
+                progress_bar.update(len(batch))
 
-            if bl_counter == 0:
-                log.debug("Entry is in no other lists.")
-                db_netlist(db_link, block_item, "INACTIVE")
-            else:
-                if bl_counter == 1:
-                    log.debug("Entry is in {} other list.".format(bl_counter))
-                else:
-                    log.debug("Entry is in {} other lists.".format(bl_counter))
+        # Commit whatever is left of a transactional apply.
+        if not db_link.autocommit:
+            db_changelog_flush(db_link)
+            db_link.commit()
+            db_link.autocommit = True
+
+    except psycopg2.Error as error:
+        log.error("List {} apply failed: {}".format(entry['ident'], error))
+
+        if not db_link.autocommit:
+            db_link.rollback()
+            db_link.autocommit = True
 
-            # Update our history logs.
-            history_string = "source={}, action=DELETE, host={}".format(entry['ident'], block_item)
-            db_history_add(db_link, entry['ident'], block_item, "ADD", history_string)
+        if show_progress:
+            progress_bar.close()
+
+        db_proc_unlock(db_link, entry['ident'], False)
+        return
 
-        # Update the progress bar before finishing out the loop.
-        if logging.root.level != logging.DEBUG:
-            progress_bar.update(1)
+    log.debug("Entries in no other lists: {}".format(counter_inactive))
 
     # Close out the progress bar.
-    if logging.root.level != logging.DEBUG:
+    if show_progress and len(remove_list) > 0:
         progress_bar.close()
 
+    list_summary(entry['ident'], len(list_set), counter_add, counter_delete, counter_update, len(excluded),
+                 not show_progress)
+
+    # Skipped changes are left for the next run, so the feed isn't taken as applied.
+    if counter_failed > 0:
+        log.error("List {}: {} changes skipped.  The list will be applied again next run.".format(entry['ident'],
+                                                                                                 counter_failed))
+        db_proc_unlock(db_link, entry['ident'], False)
+        return
+
     # Unlock the database and increment the success counter.
     db_proc_unlock(db_link, entry['ident'], True)
-
-    print(" Add/Del..: {} / {}".format(counter_add, counter_delete))
-    if counter_update > 0:
-        print(" Updates..: {}".format(counter_update))
+    cache_meta_applied(feed_state)
 
     return
 
 
+def list_worker(entry, bulk=False, exclusions=None, force=False, acquired=None, prepare=True, chunk=None):
+    """
+    This function processes a block list on its own database connection, so several lists can be applied at once.
+
+    :param entry:
+    :param bulk:
+    :param exclusions:
+    :param force:
+    :param acquired:
+    :param prepare:
+    :param chunk:
+    :return:
+    """
+    log = logging.getLogger("rtbh-listrunner/list_worker")
+
+    db_link = db_connect(prepare)
+
+    if db_link is None:
+        log.error("No database connection for list {}.".format(entry['ident']))
+        return
+
+    try:
+        list_processor(db_link, entry, bulk, exclusions, force, acquired, progress=False, chunk=chunk)
+    finally:
+        db_link.close()
+
+
 if __name__ == "__main__":
     logger = logging.getLogger("rtbh-listrunner")
 
     # Process CLI arguments
     args = cli_args()
     list = vars(args)['list']
+    bulk = vars(args)['bulk']
+    force = vars(args)['force']
+    workers = max(1, vars(args)['workers'])
+    prepare = not vars(args)['no_prepare']
+    chunk = vars(args)['chunk']
+    if chunk is None and vars(args)['transaction']:
+        chunk = 0
 
     # Load module configuration.
     if not load_config("rtbh-config.yaml"):
@@ -928,31 +1799,86 @@ if __name__ == "__main__":
         logger.error("FATAL: No lists configured for processing.")
         exit(1)
 
+    # Compile the exclusions once for the whole run.
+    exclusions = ExclusionMatcher.from_config(config['listrunner'].get('exclude'))
+
+    # Bulk reconciliation may also be enabled through configuration.
+    if 'bulk' in config['listrunner'] and config['listrunner']['bulk']:
+        bulk = True
+
+    # Transactional apply may also be enabled through configuration.
+    if chunk is None and 'transaction' in config['listrunner'] and config['listrunner']['transaction']:
+        chunk = 0
+        if isinstance(config['listrunner']['transaction'], dict):
+            chunk = config['listrunner']['transaction'].get('chunk', 0)
+
     print()
 
     # Note our starting time.
     startTime = datetime.datetime.now()
 
     # Open up the database for business.
-    try:
-        db_link = psycopg2.connect(host=dbHost, port=dbPort, database=dbName, user=dbUserName, password=dbUserPass)
-        db_link.autocommit = True
-        logger.debug("Database {} open".format(dbName))
-    except Exception as error:
-        logger.error("Could not open database: {}".format(error))
+    db_link = db_connect(prepare)
+    if db_link is None:
         exit(2)
 
+    # Acquisition Stage!  Every selected list is downloaded and parsed before any database work starts.
+    fetch_workers = 4
+    fetch_timeout = None
+    if 'fetch' in config['listrunner']:
+        fetch_workers = config['listrunner']['fetch'].get('workers', fetch_workers)
+        fetch_timeout = config['listrunner']['fetch'].get('timeout', fetch_timeout)
+
+    selected = []
+    for entry in config['listrunner']['lists']:
+        if (list == "ALL" and 'auto' in entry) or entry['ident'] == list:
+            selected.append(entry)
+
+    # Large CSV feeds are parsed by one pool of processes for the whole run.  It is started here rather than by each
+    # download thread, and its workers are spawned afresh rather than forked from a process full of threads.
+    csv_workers = max([entry['csv'].get('workers', 1) for entry in selected
+                       if entry.get('type') == 'csv' and 'csv' in entry] or [1])
+    csv_pool = None
+    if csv_workers > 1:
+        csv_pool = concurrent.futures.ProcessPoolExecutor(max_workers=csv_workers,
+                                                          mp_context=multiprocessing.get_context('spawn'))
+
+    try:
+        acquired = list_acquire_all(selected, fetch_workers, fetch_timeout, force, csv_pool)
+    finally:
+        if csv_pool is not None:
+            csv_pool.shutdown()
+
     # List Loop!
     logger.debug("Starting List Loop")
-    for entry in config['listrunner']['lists']:
-        if list == "ALL" and 'auto' in entry:
-            logger.debug("Processing {}".format(entry['ident']))
-            list_processor(db_link, entry)
-        elif entry['ident'] == list:
-            logger.debug("Processing {}".format(entry['ident']))
-            list_processor(db_link, entry)
-        else:
-            logger.debug("Not processing {}".format(entry['ident']))
+    if workers > 1 and len(selected) > 1:
+        print("Applying {} lists, {} at a time.".format(len(selected), workers))
+        since = changelog_last(db_link)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {}
+            for entry in selected:
+                logger.debug("Processing {}".format(entry['ident']))
+                future = executor.submit(list_worker, entry, bulk, exclusions, force, acquired[entry['ident']], prepare,
+                                         chunk)
+                futures[future] = entry
+
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    future.result()
+                except Exception as error:
+                    logger.error("List {} failed: {}".format(futures[future]['ident'], error))
+
+        # Lists sharing an address may have raced on its netlist entry.
+        db_netlist_sync(db_link, ["LR-{}".format(entry['ident']) for entry in selected], since)
+
+    else:
+        for entry in config['listrunner']['lists']:
+            if entry in selected:
+                logger.debug("Processing {}".format(entry['ident']))
+                list_processor(db_link, entry, bulk, exclusions, force, acquired[entry['ident']], chunk=chunk)
+            else:
+                logger.debug("Not processing {}".format(entry['ident']))
 
     # Close the database
     db_link.close()
@@ -967,4 +1893,5 @@ if __name__ == "__main__":
     print("------------")
     print("Start time.: {}".format(startTime))
     print("End time...: {}".format(endTime))
+    print("Statements.: {} ({:.0f}/s)".format(statement_stats.count, statement_stats.rate()))
     print("------------")
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from globals import *
+from changelog import changelog_since
 
 # Internal Imports
 import argparse
@@ -49,6 +50,16 @@ def cli_args():
                           help='IPv4 address in CIDR notation.',
                           required=True)
 
+    # Changes Sub Parser
+    op_changes = sub_parser.add_parser('changes',
+                                       help='This operation lists the block list changes after a sequence number.')
+    op_changes.set_defaults(operation='changes')
+    op_changes.add_argument('--since',
+                            action='store',
+                            type=int,
+                            default=0,
+                            help='Last sequence number already seen.  0 (everything) is default.')
+
     # Assign the arguments to a variable
     arguments = cli_parser.parse_args()
 
@@ -231,6 +242,42 @@ def op_summary(db_link, last):
     return
 
 
+def op_changes(db_link, since):
+    """
+    This procedure prints out the net block list changes after a sequence number, along with the sequence number to
+    ask from next time.
+
+    :param db_link:
+    :param since:
+    :return:
+    """
+    last, added, removed = changelog_since(db_link, since)
+
+    print("RTBH Block List Changes")
+    print("=======================")
+    print("Since Sequence: {}".format(since))
+    print("Last Sequence.: {}".format(last))
+
+    if added is None:
+        print("Removals since sequence {} have been compacted away.  Start again from 0.".format(since))
+        return
+
+    print("Added.........: {}".format(len(added)))
+    print("Removed.......: {}".format(len(removed)))
+    print()
+
+    for address, source, score in added:
+        if score:
+            print("+ {} {} / {}".format(address, source, score))
+        else:
+            print("+ {} {}".format(address, source))
+
+    for address, source in removed:
+        print("- {} {}".format(address, source))
+
+    return
+
+
 if __name__ == "__main__":
 
     logger = logging.getLogger("rtbh-query")
@@ -266,6 +313,8 @@ if __name__ == "__main__":
         op_summary(db_link, vars(args)['last'])
     elif vars(args)['operation'] == 'query':
         op_query(db_link, vars(args)['cidr'])
+    elif vars(args)['operation'] == 'changes':
+        op_changes(db_link, vars(args)['since'])
 
     # Close the database
     db_link.close()
@@ -1,14 +1,25 @@
 #!/usr/bin/env python3
 
+import requests
+import requests.adapters
 import requests.exceptions
 
 from globals import *
+from pacing import BatchController, ConvergenceTracker
+from payload import MASKS, RoutePayload, route_batch, route_removal
+from prefixset import PrefixSet, collapse_prefixes, int_to_prefix
+from statements import StatementConnection, execute_prepared, statement_stats
 
 # Internal Imports
 import argparse
+import codecs
+import collections
+import concurrent.futures
 import datetime
+import hashlib
 import json
 import logging
+import queue
 import time
 
 # External Imports
@@ -21,6 +32,10 @@ import yaml
 import yaml.scanner
 
 
+# FIB convergence after a timed out base route PUT, by router.
+convergence_stats = {}
+
+
 def cli_args():
     """
     Process CLI Arguments and return the namespace.
@@ -39,6 +54,19 @@ def cli_args():
                             action='store',
                             default='ALL',
                             help="Update a single router as specified, otherwise process all of them.")
+    cli_parser.add_argument('--sync',
+                            action='store',
+                            choices=['full', 'incremental'],
+                            default=None,
+                            help="Replace every route on the router (full), or only send the differences (incremental).")
+    cli_parser.add_argument('--workers',
+                            action='store',
+                            type=int,
+                            default=None,
+                            help="Deploy this many routers at once, each with its own sessions.")
+    cli_parser.add_argument('--force',
+                            action='store_true',
+                            help="Update routers even if they already have the current block list.")
     cli_parser.add_argument('--unlock',
                             action='store',
                             default='ALL',
@@ -89,6 +117,30 @@ def load_config(config_file):
     return True
 
 
+def db_connect():
+    """
+    This function opens a new autocommit connection to the database.
+
+    :return: Database connection, or None if it could not be opened.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/db_connect")
+
+    try:
+        db_link = psycopg2.connect(host=config['database']['dbHost'],
+                                   port=config['database']['dbPort'],
+                                   database=config['database']['dbName'],
+                                   user=config['database']['dbUserName'],
+                                   password=config['database']['dbUserPass'],
+                                   connection_factory=StatementConnection)
+        db_link.autocommit = True
+        log.debug("Database {} open".format(config['database']['dbName']))
+    except Exception as error:
+        log.error("Could not open database: {}".format(error))
+        return None
+
+    return db_link
+
+
 def db_proc_check(db_link, ident):
     """
     This function checks the current status of a process and returns it.
@@ -102,9 +154,9 @@ def db_proc_check(db_link, ident):
     db = db_link.cursor()
 
     log.debug("Checking for {} process.".format(ident))
-    sql = "SELECT * from processes WHERE processname = 'RR-{}' LIMIT 1".format(ident)
+    sql = "SELECT * from processes WHERE processname = $1 LIMIT 1"
 
-    db.execute(sql)
+    execute_prepared(db, "rr_proc_check", sql, ("RR-{}".format(ident),))
 
     status = "UNLOCKED"
 
@@ -117,8 +169,8 @@ def db_proc_check(db_link, ident):
 
     if row is None:
         sql = "INSERT INTO processes (processname, status, runlast, runsuccess, runfailure) VALUES" \
-              "('RR-{}', '{}', current_timestamp, 0, 0)".format(ident, status)
-        db.execute(sql)
+              "($1, $2, current_timestamp, 0, 0)"
+        execute_prepared(db, "rr_proc_insert", sql, ("RR-{}".format(ident), status))
         log.debug("Added RR-{} to process list.".format(ident))
     else:
         status = row[1]
@@ -140,8 +192,8 @@ def db_proc_lock(db_link, ident):
 
     db = db_link.cursor()
 
-    sql = "UPDATE processes SET runlast = current_timestamp, status = 'LOCKED' WHERE processname = 'RR-{}'".format(ident)
-    db.execute(sql)
+    sql = "UPDATE processes SET runlast = current_timestamp, status = 'LOCKED' WHERE processname = $1"
+    execute_prepared(db, "rr_proc_lock", sql, ("RR-{}".format(ident),))
     db.close()
 
     log.debug("Locked RR-{} in database.".format(ident))
@@ -160,40 +212,205 @@ def db_proc_unlock(db_link, ident, success=True):
 
     db = db_link.cursor()
 
-    sql = "UPDATE processes SET runlast = current_timestamp, status = 'UNLOCKED' WHERE processname = 'RR-{}'".format(ident)
-    db.execute(sql)
+    sql = "UPDATE processes SET runlast = current_timestamp, status = 'UNLOCKED' WHERE processname = $1"
+    execute_prepared(db, "rr_proc_unlock", sql, ("RR-{}".format(ident),))
     log.debug("Unlocked RR-{} in database.".format(ident))
 
     if success:
-        sql = "UPDATE processes set runsuccess = runsuccess + 1 WHERE processname = 'RR-{}'".format(ident)
+        sql = "UPDATE processes set runsuccess = runsuccess + 1 WHERE processname = $1"
+        execute_prepared(db, "rr_proc_success", sql, ("RR-{}".format(ident),))
         log.debug("Incremented success counter.")
     else:
-        sql = "UPDATE processes set runfailure = runfailure + 1 WHERE processname = 'RR-{}'".format(ident)
+        sql = "UPDATE processes set runfailure = runfailure + 1 WHERE processname = $1"
+        execute_prepared(db, "rr_proc_failure", sql, ("RR-{}".format(ident),))
         log.debug("Incremented failure counter.")
 
-    db.execute(sql)
     db.close()
 
 
-def db_blocklist_get(db_link):
-    log = logging.getLogger("rtbh-routerunner-xe/db_blocklist_get")
+def db_checkpoint_get(db_link, ident):
+    """
+    This function returns the checkpoint of the last push to a router.
+
+    :param db_link:
+    :param ident:
+    :return: Tuple of the generation pushed, the routes acknowledged and the routes in the push, or None.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/db_checkpoint_get")
 
     db = db_link.cursor()
-    block_list = {}
 
-    sql = "SELECT address, STRING_AGG(source, '|') AS sources FROM blocklist GROUP BY address"
-    db.execute(sql)
+    sql = "SELECT generation, acknowledged, total FROM checkpoints WHERE processname = $1"
+    execute_prepared(db, "rr_checkpoint_get", sql, ("RR-{}".format(ident),))
+
+    row = db.fetchone()
+    db.close()
+
+    if row is not None:
+        log.debug("Checkpoint for RR-{}: {} of {} routes of generation {}".format(ident, row[1], row[2], row[0]))
+
+    return row
 
-    log.debug("Loading full blocklist.")
 
-    for row in db:
-        block_list.update({row[0]: row[1]})
+def db_checkpoint_set(db_link, ident, generation, acknowledged, total):
+    """
+    This function records how far a push to a router has got.
 
+    :param db_link:
+    :param ident:
+    :param generation: Generation of the payload being pushed, or None while no push can be resumed.
+    :param acknowledged: Routes acknowledged by the router so far, from the start of the push.
+    :param total: Routes in the push.
+    :return:
+    """
+    db = db_link.cursor()
+
+    sql = "INSERT INTO checkpoints (processname, generation, acknowledged, total, updated) VALUES " \
+          "($1, $2, $3, $4, current_timestamp) ON CONFLICT (processname) DO UPDATE SET " \
+          "generation = EXCLUDED.generation, acknowledged = EXCLUDED.acknowledged, total = EXCLUDED.total, " \
+          "updated = current_timestamp"
+    execute_prepared(db, "rr_checkpoint_set", sql, ("RR-{}".format(ident), generation, acknowledged, total))
     db.close()
 
+
+def router_current(db_link, entry, fingerprint):
+    """
+    This function checks whether a router already has every route of a block list.
+
+    :param db_link:
+    :param entry:
+    :param fingerprint: Fingerprint of the block list, from db_blocklist_get.
+    :return:
+    """
+    checkpoint = db_checkpoint_get(db_link, entry['ident'])
+
+    return checkpoint is not None and checkpoint[0] == fingerprint and checkpoint[1] == checkpoint[2]
+
+
+def db_blocklist_rows(db_link, itersize=10000):
+    """
+    This function yields the block list a few rows at a time from a server-side cursor, so neither the database
+    driver nor this process ever holds the whole result.  Addresses are yielded in network order.
+
+    :param db_link:
+    :param itersize: Rows fetched from the server at a time.
+    :return:
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/db_blocklist_rows")
+
+    # A server-side cursor only lives as long as its transaction.
+    autocommit = db_link.autocommit
+    db_link.autocommit = False
+
+    db = db_link.cursor(name="rr_blocklist")
+    db.itersize = itersize
+
+    try:
+        # The sources are joined in order, as the route names and the block list fingerprint are built from them.
+        sql = "SELECT address, STRING_AGG(source, '|' ORDER BY source) AS sources FROM blocklist " \
+              "GROUP BY address ORDER BY address"
+        db.execute(sql)
+
+        log.debug("Streaming blocklist, {} rows at a time.".format(itersize))
+
+        for row in db:
+            yield row
+
+    finally:
+        db.close()
+        db_link.commit()
+        db_link.autocommit = autocommit
+
+
+def db_blocklist_get(db_link, aggregate=None, itersize=10000):
+    """
+    This function loads the full block list as a labelled prefix set, where each address carries its sources.
+
+    The addresses arrive in network order, so they are appended to the set as they stream in without it ever having to
+    be sorted.  A fingerprint of the block list is taken at the same time, covering every address, its sources and the
+    tag its route will carry, along with the aggregation setting.  Two runs with the same fingerprint deploy the same
+    routes.
+
+    :param db_link:
+    :param aggregate: Shortest prefix length aggregation may produce, or None.
+    :param itersize: Rows fetched from the server at a time.
+    :return: Tuple of the block list, and its fingerprint.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/db_blocklist_get")
+
+    block_list = PrefixSet(labelled=True)
+
+    tag_list, tag_default = route_tags()
+    fingerprint = hashlib.sha256("aggregate {}\n".format(aggregate).encode())
+
+    log.debug("Loading full blocklist.")
+
+    for address, sources in db_blocklist_rows(db_link, itersize):
+        block_list.add(address, sources)
+        fingerprint.update("{} {} {}\n".format(address, sources, tag_list.get(sources, tag_default)).encode())
+
     log.debug("Blocklist length: {}".format(len(block_list)))
 
-    return block_list
+    return block_list, fingerprint.hexdigest()
+
+
+def route_tags():
+    """
+    This function maps each listrunner source to the tag configured for its list.
+
+    :return: Tuple of the source to tag dictionary, and the default tag or None.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/route_tags")
+
+    tag_list = {}
+    for item in config['listrunner']['lists']:
+        if 'tag' in item:
+            source = 'LR-{}'.format(item['ident'])
+            tag_list[source] = item['tag']
+            log.debug("Tag List: {} / {}".format(source, item['tag']))
+
+    return tag_list, config['routerunner']['tags'].get('default')
+
+
+def blocklist_routes(blocklist, aggregate=None):
+    """
+    This function turns the block list into the routes to deploy, each labelled with its route name and tag.
+
+    An address takes the tag of its source, or the default tag if it has none or is on several lists.  With
+    aggregation, adjacent and contained prefixes with the same tag are collapsed into as few routes as possible, down
+    to the shortest prefix length allowed.  A collapsed route is named for all of the sources merged into it.
+
+    :param blocklist: Labelled PrefixSet of addresses and their sources.
+    :param aggregate: Shortest prefix length aggregation may produce, or None to deploy every address as it is.
+    :return: Labelled PrefixSet of routes, where each label is a tuple of (name, tag).
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/blocklist_routes")
+
+    tag_list, tag_default = route_tags()
+
+    routes = PrefixSet(labelled=True)
+
+    if aggregate is None:
+        for network, bits, sources in blocklist.entries():
+            routes.add_int(network, bits, (sources, tag_list.get(sources, tag_default)))
+        return routes
+
+    # Aggregate each tag on its own, so no route changes its tag.
+    groups = {}
+    for network, bits, sources in blocklist.entries():
+        groups.setdefault(tag_list.get(sources, tag_default), []).append((network, bits, sources))
+
+    names = {}
+    for tag, entries in groups.items():
+        for network, bits, labels in collapse_prefixes(entries, aggregate):
+            labels = frozenset(labels)
+            if labels not in names:
+                names[labels] = "|".join(sorted(set("|".join(labels).split("|"))))
+            routes.add_int(network, bits, (names[labels], tag))
+
+    log.debug("Aggregated {} addresses into {} routes.".format(len(blocklist), len(routes)))
+
+    return routes
 
 
 def restconf_fib_size(router, instance_name):
@@ -217,14 +434,241 @@ def restconf_fib_size(router, instance_name):
             return instance['num-pfx']
 
 
-def route_processor(db_link, entry, blocklist):
+def fib_converge(router, drained):
+    """
+    Follow a router's FIB until it converges after a base route PUT which timed out, or the time budget runs out.
+
+    :param router: RESTCONF connection, or anything else with a get method which takes a resource path.
+    :param drained: Prefixes the FIB is expected to lose.
+    :return: The ConvergenceTracker, once it has finished.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/fib_converge")
+
+    fib_init = restconf_fib_size(router, "IPv4:Default")
+    log.debug("Initial FIB Size: {}".format(fib_init))
+
+    tracker = ConvergenceTracker.from_config(config['routerunner'].get('convergence'),
+                                             max(0, fib_init - drained) if fib_init is not None else None)
+
+    delay = tracker.sample(fib_init)
+    while delay is not None:
+        time.sleep(delay)
+        delay = tracker.sample(restconf_fib_size(router, "IPv4:Default"))
+
+    return tracker
+
+
+def router_note(entry, message):
+    """
+    Print a progress note for a router.  Notes are written above any progress bars, so routers being deployed at the
+    same time don't garble each other.
+
+    :param entry:
+    :param message:
+    :return:
+    """
+    tqdm.tqdm.write("* {}: {}".format(entry['ident'], message))
+
+
+def router_bar(entry, total, desc, position=None):
+    """
+    Open a progress bar for a router.  Each router deployed at the same time is given its own screen line.
+
+    :param entry:
+    :param total:
+    :param desc:
+    :param position: Screen line, or None when routers are deployed one at a time.
+    :return:
+    """
+    if position is None:
+        return tqdm.tqdm(total=total, desc=' {}'.format(desc))
+
+    return tqdm.tqdm(total=total, desc='{} {}'.format(entry['ident'], desc), position=position, leave=False)
+
+
+def route_split(route_entries):
+    """
+    This function splits the static routes retrieved from a router into the base routes, which are left alone, and
+    the routes this runner manages.
+
+    :param route_entries: Iterable of ip-route-interface-forwarding-list entries.
+    :return: Tuple of the list of base route entries, and a labelled PrefixSet of managed routes, where each label is a
+             tuple of (name, tag).
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/route_split")
+
+    basename = config['routerunner']['tags']['basename']
+
+    base_routes = []
+    current = PrefixSet(labelled=True)
+
+    for route_entry in route_entries:
+        fwd = route_entry['fwd-list'][0] if route_entry.get('fwd-list') else {}
+
+        # Leave any kind of base route alone.
+        if basename in fwd.get('name', ''):
+            log.debug("Default Entry: {}".format(route_entry['prefix']))
+            base_routes.append(route_entry)
+            continue
+
+        bits = sum(bin(int(octet)).count('1') for octet in route_entry['mask'].split('.'))
+        if not current.add("{}/{}".format(route_entry['prefix'], bits), (fwd.get('name'), fwd.get('tag'))):
+            log.debug("Unreadable route: {}".format(route_entry))
+
+    return base_routes, current
+
+
+def json_array_items(chunks, key):
+    """
+    This function yields each item of a named JSON array as it arrives, so a large response never has to be held or
+    decoded all at once.  Only the first array with the given name is read.
+
+    :param chunks: Iterable of response content as bytes.
+    :param key: Name of the array, with or without a module prefix.
+    :return:
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder('utf-8')()
+    chunks = iter(chunks)
+    marker = '{}"'.format(key)
+
+    # Find the start of the array.
+    buffer = ''
+    while True:
+        i = buffer.find(marker)
+        if i >= 0:
+            j = buffer.find('[', i + len(marker))
+            if j >= 0:
+                buffer = buffer[j + 1:]
+                break
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        buffer += text.decode(chunk)
+
+    # Decode each item in turn, reading more whenever the buffer runs out part way through one.
+    pos = 0
+    while True:
+        while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+            pos += 1
+
+        if pos < len(buffer) and buffer[pos] == ']':
+            return
+
+        try:
+            if pos == len(buffer):
+                raise ValueError("Buffer exhausted")
+            item, pos = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            chunk = next(chunks, None)
+            if chunk is None:
+                if buffer[pos:].strip():
+                    raise
+                return
+            buffer = buffer[pos:] + text.decode(chunk)
+            pos = 0
+            continue
+
+        yield item
+
+
+def route_retrieve(session, entry, attempts=5):
+    """
+    This function retrieves the routes needed for an incremental sync.  Only the leaves used to compare routes are
+    asked for, and the route list is parsed as it streams in.
+
+    :param session: Keep-alive session from restconf_session.
+    :param entry:
+    :param attempts: Tries before giving up.
+    :return: As for route_split, or None if the routes could not be retrieved.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/route_retrieve")
+
+    url = restconf_url(entry, "data/native/ip/route/ip-route-interface-forwarding-list"
+                              "?fields=prefix;mask;fwd-list(fwd;name;tag)")
+
+    for attempt in range(attempts):
+        try:
+            with session.get(url, stream=True) as response:
+                if response.status_code in (204, 404):
+                    log.debug("The routing table is empty.")
+                    return [], PrefixSet(labelled=True)
+
+                if response.status_code != 200:
+                    log.error("Unable to retrieve routes: {}".format(response.status_code))
+                    return None
+
+                return route_split(json_array_items(response.iter_content(chunk_size=65536),
+                                                    'ip-route-interface-forwarding-list'))
+
+        except (requests.exceptions.RequestException, ValueError) as error:
+            log.debug("Unable to get the resource: {}".format(error))
+            router_note(entry, "Error during retrieval.  Retrying ...")
+            time.sleep(1)
+
+    return None
+
+
+def route_diff(current, desired):
+    """
+    This function works out the changes needed to bring the routes on a router in line with the routes desired.
+
+    Both sets are walked together in network order, so the comparison takes a single pass and no more memory than the
+    changes themselves.
+
+    :param current: Labelled PrefixSet of the managed routes on the router.
+    :param desired: Labelled PrefixSet of the routes to deploy.
+    :return: Tuple of a labelled PrefixSet of routes to add or update, and a list of (network, bits) routes to remove,
+             in network order.
+    """
+    changes = PrefixSet(labelled=True)
+    stale = []
+
+    current_entries = current.entries()
+    pending = next(current_entries, None)
+
+    for network, bits, label in desired.entries():
+        # Routes on the router which come before this one are no longer wanted.
+        while pending is not None and (pending[0], pending[1]) < (network, bits):
+            stale.append((pending[0], pending[1]))
+            pending = next(current_entries, None)
+
+        current_label = None
+        if pending is not None and (pending[0], pending[1]) == (network, bits):
+            current_label = pending[2]
+            pending = next(current_entries, None)
+
+        if current_label != label:
+            changes.add_int(network, bits, label)
+
+            # A patch can't take a tag away, so an untagged route replaces a tagged one.
+            if current_label is not None and label[1] is None and current_label[1] is not None:
+                stale.append((network, bits))
+
+    while pending is not None:
+        stale.append((pending[0], pending[1]))
+        pending = next(current_entries, None)
+
+    return changes, stale
+
+
+def route_processor(db_link, entry, blocklist, payload, sync="full", position=None):
     """
     Process a given black hole router.
 
+    A full sync replaces the router's static routes with its base routes, then adds the whole block list back.  An
+    incremental sync leaves the routes in place, and only adds, updates and removes what has changed.  A full push is
+    checkpointed as each batch is acknowledged, so a push which is cut short resumes from the last acknowledged batch
+    on the next run, as long as the routes to push haven't changed.
+
     :param db_link: Database Object
     :param entry: Router being worked on
-    :param blocklist: Blocks
-    :return:
+    :param blocklist: Routes, as labelled by blocklist_routes.
+    :param payload: RoutePayload of the same routes, shared by every router.
+    :param sync: full or incremental
+    :param position: Screen line for this router's progress bars, when several routers are deployed at once.
+    :return: True if the router was updated, False if the update failed, or None if the router was locked.
     """
     log = logging.getLogger("rtbh-routerunner-xe/route_processor")
 
@@ -233,14 +677,14 @@ def route_processor(db_link, entry, blocklist):
 
     if status == "LOCKED":
         log.error("Database is locked for router {}.  Skipping this run.".format(entry['ident']))
-        return
+        return None
     else:
         db_proc_lock(db_link, entry['ident'])
 
     # Test Access
     router = restconf.RestConf()
 
-    router_state = router.connect(transport='https',
+    router_state = router.connect(transport=entry.get('transport', 'https'),
                                   host=entry['ident'],
                                   un=config['routercred']['un'],
                                   pw=config['routercred']['pw'])
@@ -250,220 +694,473 @@ def route_processor(db_link, entry, blocklist):
     else:
         log.error("RESTCONF state returned: {}".format(router_state))
         db_proc_unlock(db_link, entry['ident'], False)
-        return
+        return False
+
+    window = max(1, (config['routerunner'].get('limits') or {}).get('window', 1))
+    session = restconf_session(entry, window)
+
+    # A full push which was cut short carries on from its checkpoint, as long as it is pushing the same routes.
+    resume = None
+    if sync == "full":
+        checkpoint = db_checkpoint_get(db_link, entry['ident'])
+        if checkpoint is not None and checkpoint[0] == payload.generation and \
+                checkpoint[1] < checkpoint[2] == len(payload):
+            resume = checkpoint[1]
+            router_note(entry, "Resuming the last push at route {} of {}.".format(resume, len(payload)))
 
     # Get the routes.
-    print("* Acquiring static route list.")
+    if resume is None:
+        router_note(entry, "Acquiring static route list.")
 
-    # Prepare for the next loop.
-    get_attempts = 0
-    get_success = False
+    route_dict = {}
 
-    # Sometimes, getting a very large routing table reports errors.
-    while not get_success:
-        try:
-            response = router.get("data/native/ip/route")
-            get_success = True
-        except requests.exceptions.ChunkedEncodingError as error:
-            log.debug("Unable to get the resource: {}".format(error))
-            print("ChunkedEncdingError during retrieval.")
-            db_proc_unlock(db_link, entry['ident'], False)
-            get_success = False
-            get_attempts += 1
+    # An incremental sync never writes the base routes back, so it only needs the fields used for the comparison.
+    if sync == "incremental":
+        retrieved = route_retrieve(session, entry)
 
-        if get_attempts > 4 and get_success is False:
+        if retrieved is None:
             log.error("Giving up on this run.  Try again later.")
-            return
-        elif get_success is False:
-            print("Retrying ...")
-            time.sleep(1)
+            session.close()
+            db_proc_unlock(db_link, entry['ident'], False)
+            return False
+
+        base_routes, current = retrieved
+
+    elif resume is None:
+        # Prepare for the next loop.
+        get_attempts = 0
+        get_success = False
+
+        # Sometimes, getting a very large routing table reports errors.
+        while not get_success:
+            try:
+                response = router.get("data/native/ip/route")
+                get_success = True
+            except requests.exceptions.ChunkedEncodingError as error:
+                log.debug("Unable to get the resource: {}".format(error))
+                router_note(entry, "ChunkedEncdingError during retrieval.")
+                get_success = False
+                get_attempts += 1
+
+            if get_attempts > 4 and get_success is False:
+                log.error("Giving up on this run.  Try again later.")
+                session.close()
+                db_proc_unlock(db_link, entry['ident'], False)
+                return False
+            elif get_success is False:
+                router_note(entry, "Retrying ...")
+                time.sleep(1)
 
-    # Work with what we have managed to retrieve.
-    if response.status_code == 204:
-        log.debug("The routing table is empty.")
-        route_dict = {}
-    elif response.status_code == 200:
-        log.debug("The routing table is found.")
-        if response.content is not None:
-            route_dict = json.loads(response.content)
+        # Work with what we have managed to retrieve.
+        if response.status_code == 204:
+            log.debug("The routing table is empty.")
+        elif response.status_code == 200:
+            log.debug("The routing table is found.")
+            if response.content is not None:
+                route_dict = json.loads(response.content)
+
+        base_routes, current = route_split(route_dict.get('Cisco-IOS-XE-native:route', {}).get(
+            'ip-route-interface-forwarding-list', []))
+
+    if resume is None:
+        log.debug("Base routes: {}, managed routes: {}".format(len(base_routes), len(current)))
+
+    deploy = blocklist
+    stale = []
+
+    if sync == "incremental":
+        # Only the differences are sent to the router, so the existing routes stay in place throughout.
+        router_note(entry, "Comparing {} routes on the router with {} to deploy.".format(len(current), len(blocklist)))
+
+        deploy, stale = route_diff(current, blocklist)
+
+        router_note(entry, "{} routes to add or update, {} to remove.".format(len(deploy), len(stale)))
+
+        # The router is about to be changed, so an earlier checkpoint no longer describes it.
+        if len(deploy) > 0 or len(stale) > 0:
+            db_checkpoint_set(db_link, entry['ident'], None, 0, 0)
+
+    elif resume is None:
+        # Replace the exisiting static route list with the default list.
+        router_note(entry, "Setting base routes.")
+
+        # Everything else under the route container is put back as it was.
+        route_container = route_dict.get('Cisco-IOS-XE-native:route', {})
+        route_container['ip-route-interface-forwarding-list'] = base_routes
+        route_dict = {'Cisco-IOS-XE-native:route': route_container}
+
+        # The routes are about to be drained, so an earlier checkpoint no longer describes the router.
+        db_checkpoint_set(db_link, entry['ident'], None, 0, 0)
+
+        # One does not simply replace the routing table on a large blocklist collection.
+        patched = False
+        while not patched:
+            try:
+                response = router.put("data/native/ip/route", route_dict)
+            except requests.exceptions.ChunkedEncodingError as error:
+                router_note(entry, "ChunkedEncodingError.")
+                time.sleep(5)
+                continue
+
+            if response.status_code == 204:
+                log.debug("Default placement successful!")
+                patched = True
+
+            # The rest deals with fussy routers which have a tendency to time out.
+            elif response.status_code == 504:
+                router_note(entry, "Base route state still running.  Please wait.")
+                log.debug("Gateway timeout.  This could take awhile.")
+
+                # The FIB should lose about as many prefixes as there were managed routes.
+                tracker = fib_converge(router, len(current))
+
+                fib_summary = tracker.summary()
+                convergence_stats[entry['ident']] = fib_summary
+
+                if not fib_summary['converged']:
+                    log.error("FIB did not converge within {}s.  Giving up on this run.".format(tracker.budget))
+                    session.close()
+                    db_proc_unlock(db_link, entry['ident'], False)
+                    return False
+
+                router_note(entry, "FIB converged in {:.1f}s, {} prefixes at {:.0f}/s over {} polls.".format(
+                    fib_summary['elapsed'], fib_summary['change'], fib_summary['rate'], fib_summary['samples']))
+
+            # Give up on all other 500-series errors.
+            else:
+                log.error("Received an unexpected response code from the router: {}".format(response.status_code))
+                log.error(response.text)
+                session.close()
+                db_proc_unlock(db_link, entry['ident'], False)
+                return False
+
+        # From here on, a push which is cut short can pick up where it left off.
+        db_checkpoint_set(db_link, entry['ident'], payload.generation, 0, len(payload))
+
+    # Remove the routes which are no longer on the block list, ahead of any routes which replace them.
+    if len(stale) > 0:
+        router_note(entry, "Removing stale routes.")
+
+        if logging.root.level != logging.DEBUG:
+            progress_bar = router_bar(entry, len(stale), 'Cleanup', position)
         else:
-            route_dict = {}
+            progress_bar = None
 
-    print("* Preparing base route list.")
-    # Clear all routes except for the named base.
-    route_list_len = len(route_dict['Cisco-IOS-XE-native:route']['ip-route-interface-forwarding-list'])
-    i = 0
-    while i < route_list_len:
-        route_entry = route_dict['Cisco-IOS-XE-native:route']['ip-route-interface-forwarding-list'][i]
+        removed = route_remove(session, entry, stale, progress_bar,
+                               (config['routerunner'].get('limits') or {}).get('removecount', 1000))
 
-        # Leave any kind of base route alone.
-        if config['routerunner']['tags']['basename'] in route_entry['fwd-list'][0]['name']:
-            log.debug("Default Entry: {}".format(route_entry['prefix']))
-            i += 1
+        if progress_bar is not None:
+            progress_bar.close()
+    else:
+        removed = 0
 
-        # Pop the non-base route from the list.
-        else:
-            # log.debug("Non-Default Entry: {}".format(route_entry['prefix']))
-            route_dict['Cisco-IOS-XE-native:route']['ip-route-interface-forwarding-list'].pop(i)
-            # Decrement total counter after pop
-            route_list_len -= 1
+    # Patch in the block list, in batches sized by the controller as the router responds.
+    if sync == "incremental":
+        fragments = payload.select(deploy)
+        checkpoint = None
+    else:
+        fragments = payload.fragments[resume or 0:]
 
-    # Replace the exisiting static route list with the default list.
-    print("* Setting base routes.")
+        def checkpoint(acknowledged):
+            db_checkpoint_set(db_link, entry['ident'], payload.generation, (resume or 0) + acknowledged, len(payload))
 
-    # One does not simply replace the routing table on a large blocklist collection.
-    patched = False
-    while not patched:
-        try:
-            response = router.put("data/native/ip/route", route_dict)
-        except requests.exceptions.ChunkedEncodingError as error:
-            print("  ChunkedEncodingError.")
-            time.sleep(5)
-            continue
+    controller = BatchController.from_config(config['routerunner'].get('limits'))
+    route_counter = len(fragments)
 
-        if response.status_code == 204:
-            log.debug("Default placement successful!")
-            patched = True
-
-        # The rest deals with fussy routers which have a tendency to time out.
-        elif response.status_code == 504:
-            print("  Base route state still running.  Please wait.")
-            log.debug("Gateway timeout.  This could take awhile.")
-            fib_init = restconf_fib_size(router, "IPv4:Default")
-            fib_last = fib_init
-            log.debug("Initial FIB Size: {}".format(fib_init))
-            time.sleep(15)
-
-            fib_done = False
-            while not fib_done:
-                fib_current = restconf_fib_size(router, "IPv4:Default")
-
-                if fib_current is not None:
-                    if fib_current == fib_init:
-                        log.debug("Cleanup hasn't started yet.  Waiting 30s,")
-                        time.sleep(30)
-                    elif fib_current < fib_last:
-                        log.debug("Prefix decremented: {} < {}".format(fib_current, fib_last))
-                        time.sleep(5)
-                    elif fib_current == fib_last:
-                        log.debug("Final Count: {}".format(fib_current))
-                        fib_done = True
-                    fib_last = fib_current
-
-                else:
-                    log.debug("Unable to get a FIB count.  Retry in 5.")
-                    time.sleep(5)
-
-        # Give up on all other 500-series errors.
-        else:
-            log.error("Received an unexpected response code from the router: {}".format(response.status_code))
-            log.error(response.text)
+    if logging.root.level != logging.DEBUG:
+        router_note(entry, "Deployment - Starting Batch Size: {}".format(controller.size))
+        progress_bar = router_bar(entry, len(fragments), 'Routes', position)
+    else:
+        progress_bar = None
+
+    try:
+        patched = route_patch(session, entry, fragments, controller, window, progress_bar, checkpoint)
+    finally:
+        session.close()
+
+    log.debug("Final Route Count: {}".format(route_counter))
+
+    # Close the progress bar.
+    if progress_bar is not None:
+        progress_bar.close()
+
+    batch_summary = controller.summary()
+    router_note(entry, "{} batches, {} failed, {:.2f}s mean / {:.2f}s slowest, final batch size {}.".format(
+        batch_summary['batches'], batch_summary['failures'], batch_summary['mean'], batch_summary['slowest'],
+        batch_summary['size']))
+
+    if not patched:
+        log.error("Retry budget spent on router {}.  Giving up on this run.".format(entry['ident']))
+        db_proc_unlock(db_link, entry['ident'], False)
+        return False
+
+    # Routes which could not be removed are still on the router, so it doesn't have this generation.  The new routes
+    # were still deployed, and the rest are removed on the next run.
+    if removed < len(stale):
+        log.error("Removed {} of {} stale routes from router {}.  Giving up on this run.".format(
+            removed, len(stale), entry['ident']))
+        db_proc_unlock(db_link, entry['ident'], False)
+        return False
+
+    # pprint.pprint(routes_dict)
+
+    # Save the configuration, unless an incremental sync found nothing to change.
+    if sync == "full" or len(deploy) > 0 or len(stale) > 0:
+        try:
+            response = router.post("operations/cisco-ia:save-config", None)
+            status = response.status_code
+        except requests.exceptions.RequestException as error:
+            log.debug("Save request failed: {}".format(error))
+            status = None
+
+        # The routes are in place but not saved, so the next run mustn't take the router as up to date.
+        if status != 200:
+            log.error("Unable to save the configuration on router {}: {}".format(entry['ident'], status))
+            db_checkpoint_set(db_link, entry['ident'], None, 0, 0)
             db_proc_unlock(db_link, entry['ident'], False)
-            return
+            return False
 
-    # Patch in the block list.
+        router_note(entry, "Configuration saved successfully!")
+    else:
+        router_note(entry, "No routes changed.  Configuration not saved.")
 
-    routes_dict = {}
-    routes_dict['Cisco-IOS-XE-native:route'] = {}
-    routes_dict['Cisco-IOS-XE-native:route']['ip-route-interface-forwarding-list'] = []
-    record_counter = 0
+    # An incremental sync leaves the router with the whole generation in place.
+    if sync == "incremental":
+        db_checkpoint_set(db_link, entry['ident'], payload.generation, len(payload), len(payload))
 
-    # Populate a tag list.
-    tag_list = {}
-    for item in config['listrunner']['lists']:
-        if 'tag' in item:
-            source = 'LR-{}'.format(item['ident'])
-            tag_list[source] = item['tag']
-            log.debug("Tag List: {} / {}".format(source, item['tag']))
+    # Unlock the database and increment the success counter.
+    db_proc_unlock(db_link, entry['ident'], True)
 
-    # Cycle the block list
-    batch_counter = 1
-    route_counter = 0
+    return True
 
-    if logging.root.level != logging.DEBUG:
-        print("{} Deployment - Batch Size: {}".format(entry['ident'], config['routerunner']['limits']['patchcount']))
-        progress_bar = tqdm.tqdm(total=len(blocklist.items()), desc=' Routes')
 
-    for block_addr, block_src in blocklist.items():
+def restconf_session(entry, window=1):
+    """
+    This function opens a keep-alive HTTP session to a router's RESTCONF interface, pooling enough connections for a
+    window of requests in flight.
 
-        # Reset the route dictionary if the tally is zero.
-        if record_counter == 0:
-            routes_dict['Cisco-IOS-XE-native:route']['ip-route-interface-forwarding-list'].clear()
+    :param entry:
+    :param window: Requests in flight at once.
+    :return: requests.Session
+    """
+    session = requests.Session()
+    session.auth = (config['routercred']['un'], config['routercred']['pw'])
+    session.headers.update({'Accept': 'application/yang-data+json',
+                            'Content-Type': 'application/yang-data+json'})
+    session.verify = config['routerunner'].get('verify', True)
+    session.mount('{}://'.format(entry.get('transport', 'https')),
+                  requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=window))
 
-        entry_dict = {}
-        entry_dict['fwd-list'] = []
-        entry_dict['fwd-list'].append(0)
-        entry_dict['fwd-list'][0] = {}
-        entry_dict['fwd-list'][0]['fwd'] = "Null0"
-        entry_dict['fwd-list'][0]['name'] = "{}".format(block_src)
+    return session
 
-        # Add the tag from the given source.
-        if block_src in tag_list:
-            entry_dict['fwd-list'][0]['tag'] = tag_list[block_src]
 
-        # Apply the default tag if unspecified, or an IP has multiple sources.
-        else:
-            if 'default' in config['routerunner']['tags']:
-                entry_dict['fwd-list'][0]['tag'] = config['routerunner']['tags']['default']
+def restconf_url(entry, path):
+    """
+    Return the URL of a RESTCONF resource on a router.  Routers are reached over HTTPS unless their entry sets a
+    different transport, such as plain HTTP for the simulator.
 
-        ip_record = block_addr.split('/')
-        entry_dict['prefix'] = ip_record[0]
-        entry_dict['mask'] = iupy.v4_bits_to_mask(ip_record[1])
+    :param entry:
+    :param path: Resource path below the RESTCONF root.
+    :return:
+    """
+    return "{}://{}/restconf/{}".format(entry.get('transport', 'https'), entry['ident'], path)
 
-        log.debug("Adding {} / {} / {}".format(ip_record[0], ip_record[1], block_src))
 
-        routes_dict['Cisco-IOS-XE-native:route']['ip-route-interface-forwarding-list'].append(record_counter)
-        routes_dict['Cisco-IOS-XE-native:route']['ip-route-interface-forwarding-list'][record_counter] = entry_dict
+def restconf_send(session, method, url, body, content_type=None):
+    """
+    Send a request on a session and time it.
+
+    :param session:
+    :param method:
+    :param url:
+    :param body: Request body as bytes.
+    :param content_type: Media type of the body, if not the session's default.
+    :return: Tuple of the HTTP status code, or None if the request failed, and the seconds it took.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/restconf_send")
 
-        route_counter += 1
-        record_counter += 1
+    headers = {'Content-Type': content_type} if content_type is not None else None
 
-        if record_counter % config['routerunner']['limits']['patchcount'] == 0:
-            log.debug("Applying batch {}".format(batch_counter))
+    started = time.monotonic()
+    try:
+        status = session.request(method, url, data=body, headers=headers).status_code
+    except requests.exceptions.RequestException as error:
+        log.debug("Request failed: {}".format(error))
+        status = None
 
-            patched = False
-            while not patched:
-                response = router.patch("data/native/ip/route", routes_dict)
-                if response.status_code == 204:
-                    log.debug("Batch Update Successful")
-                    patched = True
-                    record_counter = 0
-                    batch_counter += 1
-                else:
-                    # Retry.
-                    log.debug("Retrying batch ...")
+    return status, time.monotonic() - started
 
-                log.debug("Wait a second.")
-                time.sleep(1)
 
-        if logging.root.level != logging.DEBUG:
+def route_remove(session, entry, stale, progress_bar=None, batch=1000):
+    """
+    This function removes routes from a router in batches, each one a YANG Patch of remove edits, so a large cleanup
+    isn't a round trip per route.  A router which can't take a YANG Patch, or a batch which fails, leaves the rest of
+    the routes to be removed one DELETE at a time.
+
+    :param session: Keep-alive session from restconf_session.
+    :param entry:
+    :param stale: List of (network, bits) routes.
+    :param progress_bar:
+    :param batch: Routes in each YANG Patch, or 0 to remove every route by itself.
+    :return: Number of routes removed.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/route_remove")
+
+    removed = 0
+
+    while batch and removed < len(stale):
+        chunk = stale[removed:removed + batch]
+        status, elapsed = restconf_send(session, 'PATCH', restconf_url(entry, "data/native/ip/route"),
+                                        route_removal(chunk), 'application/yang-patch+json')
+
+        if status not in (200, 204):
+            log.debug("YANG Patch removal failed ({}).  Removing the remaining {} routes one at a time.".format(
+                status, len(stale) - removed))
+            break
+
+        log.debug("Removed {} routes in {:.2f}s".format(len(chunk), elapsed))
+        removed += len(chunk)
+
+        if progress_bar is not None:
+            progress_bar.update(len(chunk))
+
+    for network, bits in stale[removed:]:
+        route_key = "{},{}".format(int_to_prefix(network, bits).split('/')[0], MASKS[bits])
+        status, elapsed = restconf_send(session, 'DELETE', restconf_url(
+            entry, "data/native/ip/route/ip-route-interface-forwarding-list={}".format(route_key)), None)
+
+        if status == 204:
+            log.debug("Removed {}".format(route_key))
+            removed += 1
+        else:
+            log.error("Unable to remove {}: {}".format(route_key, status))
+
+        if progress_bar is not None:
             progress_bar.update(1)
 
-    # Apply the final patch round.
-    if record_counter % config['routerunner']['limits']['patchcount'] != 0:
-        log.debug("Applying Final batch {}".format(batch_counter))
-        response = router.patch("data/native/ip/route", routes_dict)
-        if response.status_code == 204:
-            log.debug("Final Batch Update Successful")
+    return removed
 
-    log.debug("Final Route Count: {}".format(route_counter))
 
-    # Close the progress bar.
-    if logging.root.level != logging.DEBUG:
-        progress_bar.close()
+def route_patch(session, entry, fragments, controller, window=1, progress_bar=None, checkpoint=None):
+    """
+    This function patches routes into a router in batches sized by the controller.  With a window above one, that
+    many batches are kept in flight at once, so the push isn't left waiting on the round trip for every batch.
+
+    Batches are acknowledged in the order they were sent.  A batch which fails is cut down to the batch size the
+    controller has shrunk to, and the pieces are sent again in its place at the head of the window, while the batches
+    behind it carry on.  The routes are unique and in address order, so no route is in more than one batch, and a
+    retried batch can't undo a later one.
+
+    :param session: Keep-alive session from restconf_session.
+    :param entry:
+    :param fragments: List of serialized routes from a RoutePayload.
+    :param controller: BatchController for the router.
+    :param window: Batches in flight at once.
+    :param progress_bar:
+    :param checkpoint: Called with the number of routes acknowledged so far, after each batch is acknowledged.
+    :return: True once every route is deployed, or False if the retry budget ran out first.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/route_patch")
 
-    # pprint.pprint(routes_dict)
+    url = restconf_url(entry, "data/native/ip/route")
 
-    # Save the configuration
-    response = router.post("operations/cisco-ia:save-config", None)
+    next_start = 0
+    in_flight = collections.deque()
+    acknowledged = 0
 
-    if response.status_code == 200:
-        print("* Configuration saved successfully!")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=window) as executor:
+        while next_start < len(fragments) or in_flight:
+            sending = sum(1 for item in in_flight if item[0] is not None)
 
-    # Unlock the database and increment the success counter.
-    db_proc_unlock(db_link, entry['ident'], True)
+            # The pieces of a failed batch go out first, in order.
+            for item in in_flight:
+                if sending >= window:
+                    break
+                if item[0] is None:
+                    item[0] = executor.submit(restconf_send, session, 'PATCH', url,
+                                              route_batch(fragments[item[1]:item[2]]))
+                    sending += 1
+
+            # Fill the rest of the window.
+            while sending < window and next_start < len(fragments):
+                end = min(len(fragments), next_start + controller.size)
+                future = executor.submit(restconf_send, session, 'PATCH', url,
+                                         route_batch(fragments[next_start:end]))
+                in_flight.append([future, next_start, end, 0])
+                next_start = end
+                sending += 1
+
+            # Wait on the oldest batch in the window.
+            future, start, end, attempt = in_flight[0]
+            status, elapsed = future.result()
+            pause = controller.record(end - start, elapsed, status)
+
+            if status == 204:
+                log.debug("Batch of routes {}-{} acknowledged.".format(start, end))
+                in_flight.popleft()
+                acknowledged = end
+
+                if progress_bar is not None:
+                    progress_bar.update(end - start)
+
+                if checkpoint is not None:
+                    checkpoint(acknowledged)
+
+                if pause > 0:
+                    log.debug("Pausing {:.2f}s.".format(pause))
+                    time.sleep(pause)
+                continue
+
+            delay = controller.retry(attempt)
+            if delay is None:
+                for item in in_flight:
+                    if item[0] is not None:
+                        item[0].cancel()
+                log.debug("Routes acknowledged before giving up: {}".format(acknowledged))
+                return False
+
+            log.debug("Retrying routes {}-{} in {:.2f}s, {} at a time ...".format(start, end, delay, controller.size))
+            time.sleep(delay)
+
+            # Queue the failed batch again in its slot, cut down to the new batch size.
+            in_flight.popleft()
+            for piece in reversed(range(start, end, controller.size)):
+                in_flight.appendleft([None, piece, min(end, piece + controller.size), attempt + 1])
+
+    return True
+
+
+def router_worker(entry, blocklist, payload, sync="full", positions=None):
+    """
+    This function deploys a router on its own database connection, so several routers can be deployed at once.
+
+    :param entry:
+    :param blocklist:
+    :param payload:
+    :param sync:
+    :param positions: Queue of free screen lines for progress bars.
+    :return: Tuple of the route_processor result, and the time taken in seconds.
+    """
+    log = logging.getLogger("rtbh-routerunner-xe/router_worker")
+
+    started = time.monotonic()
+
+    db_link = db_connect()
+
+    if db_link is None:
+        log.error("No database connection for router {}.".format(entry['ident']))
+        return False, time.monotonic() - started
+
+    position = positions.get() if positions is not None else None
+
+    try:
+        result = route_processor(db_link, entry, blocklist, payload, sync, position)
+    finally:
+        db_link.close()
+        if positions is not None:
+            positions.put(position)
 
-    return
+    return result, time.monotonic() - started
 
 
 if __name__ == "__main__":
@@ -472,6 +1169,9 @@ if __name__ == "__main__":
     # Process CLI arguments
     args = cli_args()
     router = vars(args)['router']
+    sync = vars(args)['sync']
+    workers = vars(args)['workers']
+    force = vars(args)['force']
 
     # Load module configuration.
     if not load_config("rtbh-config.yaml"):
@@ -530,28 +1230,81 @@ if __name__ == "__main__":
     startTime = datetime.datetime.now()
 
     # Open up the database for business.
-    try:
-        db_link = psycopg2.connect(host=dbHost, port=dbPort, database=dbName, user=dbUserName, password=dbUserPass)
-        db_link.autocommit = True
-        logger.debug("Database {} open".format(dbName))
-    except Exception as error:
-        logger.error("Could not open database: {}".format(error))
+    db_link = db_connect()
+    if db_link is None:
         exit(2)
 
+    # The sync mode may also be set through configuration.
+    if sync is None:
+        sync = config['routerunner'].get('sync', 'full')
+
+    # Work out the aggregation, if configured.
+    aggregate = None
+    if 'aggregate' in config['routerunner']:
+        aggregate = 24
+        if isinstance(config['routerunner']['aggregate'], dict):
+            aggregate = config['routerunner']['aggregate'].get('shortest', aggregate)
+
     # Acquire the block list
-    blocklist = db_blocklist_get(db_link)
+    blocklist, fingerprint = db_blocklist_get(db_link, aggregate, config['routerunner'].get('itersize', 10000))
 
-    # Router Loop
+    # The number of routers deployed at once may also be set through configuration.
+    if workers is None:
+        workers = config['routerunner'].get('workers', 1)
+    workers = max(1, workers)
+
+    # Routers which already have this block list are left alone.
+    results = {}
+    selected = []
     for entry in config['routerunner']['routers']:
-        if router == "ALL" and 'auto' in entry:
-            print("Processing {}".format(entry['ident']))
-            route_processor(db_link, entry, blocklist)
-        elif entry['ident'] == router:
-            print("Processing {}".format(entry['ident']))
-            route_processor(db_link, entry, blocklist)
+        if (router == "ALL" and 'auto' in entry) or entry['ident'] == router:
+            if not force and router_current(db_link, entry, fingerprint):
+                print("Router {} is up to date.".format(entry['ident']))
+                results[entry['ident']] = ("unchanged", None)
+            else:
+                selected.append(entry)
         else:
             print("Not processing {}".format(entry['ident']))
 
+    if len(selected) > 0:
+        # Work out the routes to deploy.
+        routes = blocklist_routes(blocklist, aggregate)
+
+        if aggregate is not None and len(blocklist) > 0:
+            print("Aggregated {} addresses into {} routes ({:.1%} reduction).".format(
+                len(blocklist), len(routes), 1 - len(routes) / len(blocklist)))
+
+        # The route entries are serialized once, and shared by every router.
+        payload = RoutePayload(routes, fingerprint)
+
+        # Router Loop
+        if workers > 1 and len(selected) > 1:
+            print("Deploying {} routers, {} at a time.".format(len(selected), workers))
+
+            positions = queue.Queue()
+            for position in range(min(workers, len(selected))):
+                positions.put(position)
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = {}
+                for entry in selected:
+                    print("Processing {}".format(entry['ident']))
+                    futures[executor.submit(router_worker, entry, routes, payload, sync, positions)] = entry
+
+                for future in concurrent.futures.as_completed(futures):
+                    try:
+                        results[futures[future]['ident']] = future.result()
+                    except Exception as error:
+                        logger.error("Router {} failed: {}".format(futures[future]['ident'], error))
+                        results[futures[future]['ident']] = (False, None)
+
+        else:
+            for entry in selected:
+                print("Processing {}".format(entry['ident']))
+                started = time.monotonic()
+                results[entry['ident']] = (route_processor(db_link, entry, routes, payload, sync),
+                                         time.monotonic() - started)
+
     # Note our ending time.
     endTime = datetime.datetime.now()
 
@@ -561,4 +1314,19 @@ if __name__ == "__main__":
     print("------------")
     print("Start time.: {}".format(startTime))
     print("End time...: {}".format(endTime))
+    print("Statements.: {} ({:.0f}/s)".format(statement_stats.count, statement_stats.rate()))
+    for entry in config['routerunner']['routers']:
+        if entry['ident'] not in results:
+            continue
+        result, duration = results[entry['ident']]
+        outcome = {True: "updated", False: "failed", None: "locked", "unchanged": "unchanged"}[result]
+        if duration is None:
+            print("Router.....: {} {}".format(entry['ident'], outcome))
+        else:
+            print("Router.....: {} {} in {:.1f}s".format(entry['ident'], outcome, duration))
+        if entry['ident'] in convergence_stats:
+            fib_summary = convergence_stats[entry['ident']]
+            print("FIB........: {} {} in {:.1f}s, {} prefixes at {:.0f}/s".format(
+                entry['ident'], "converged" if fib_summary['converged'] else "timed out", fib_summary['elapsed'],
+                fib_summary['change'], fib_summary['rate']))
     print("------------")
\ No newline at end of file
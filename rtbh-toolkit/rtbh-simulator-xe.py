@@ -0,0 +1,662 @@
+#!/usr/bin/env python3
+
+from globals import *
+
+# Internal Imports
+import argparse
+import http.server
+import json
+import logging
+import random
+import re
+import socket
+import ssl
+import struct
+import threading
+import time
+import urllib.parse
+
+ROUTE_PATH = "/restconf/data/native/ip/route"
+ROUTE_LIST_PATH = ROUTE_PATH + "/ip-route-interface-forwarding-list"
+FIB_PATH = "/restconf/data/Cisco-IOS-XE-fib-oper:fib-oper-data/fib-ni-entry"
+SAVE_PATH = "/restconf/operations/cisco-ia:save-config"
+
+
+def cli_args():
+    """
+    Process CLI Arguments and return the namespace.
+
+    :return:
+    """
+    _logger = logging.getLogger("rtbh-simulator-xe/cli_args")
+
+    cli_parser = argparse.ArgumentParser(description="RTBH IOS-XE RESTCONF Simulator v{}".format(version),
+                                         epilog="This program stands in for an IOS-XE router, so the routerunner can "
+                                                "be exercised and timed without one.")
+
+    cli_parser.add_argument('-d', '--debug',
+                            action='store_true',
+                            help="Enable script debugging.  This is a LOT of output.")
+    cli_parser.add_argument('--host',
+                            action='store',
+                            default='127.0.0.1',
+                            help="Address to listen on.  127.0.0.1 is default.")
+    cli_parser.add_argument('--port',
+                            action='store',
+                            type=int,
+                            default=8080,
+                            help="Port to listen on.  8080 is default.")
+    cli_parser.add_argument('--cert',
+                            action='store',
+                            default=None,
+                            help="Certificate file.  With --key, the simulator is served over HTTPS.")
+    cli_parser.add_argument('--key',
+                            action='store',
+                            default=None,
+                            help="Private key file for the certificate.")
+    cli_parser.add_argument('--latency',
+                            action='store',
+                            type=float,
+                            default=0.0,
+                            help="Seconds added to every request.")
+    cli_parser.add_argument('--route-latency',
+                            action='store',
+                            type=float,
+                            default=0.0,
+                            help="Seconds added for each route written or removed.")
+    cli_parser.add_argument('--timeout',
+                            action='store',
+                            type=float,
+                            default=0.0,
+                            help="Answer a write which takes longer than this many seconds with a 504, after "
+                                 "applying it, as a router does.  0 (never) is default.")
+    cli_parser.add_argument('--error-rate',
+                            action='store',
+                            type=float,
+                            default=0.0,
+                            help="Fraction of writes refused with a 503, without being applied.")
+    cli_parser.add_argument('--chunk-error-rate',
+                            action='store',
+                            type=float,
+                            default=0.0,
+                            help="Fraction of route retrievals cut off part way through.")
+    cli_parser.add_argument('--fib-rate',
+                            action='store',
+                            type=float,
+                            default=0.0,
+                            help="Prefixes per second the FIB gains or loses as it converges.  0 (at once) is "
+                                 "default.")
+    cli_parser.add_argument('--base',
+                            action='store',
+                            type=int,
+                            default=0,
+                            help="Number of base routes the simulator starts with.")
+    cli_parser.add_argument('--basename',
+                            action='store',
+                            default='DEFAULT',
+                            help="Route name given to the base routes.  DEFAULT is default.")
+    cli_parser.add_argument('--seed',
+                            action='store',
+                            type=int,
+                            default=None,
+                            help="Random seed for injected errors.")
+
+    # Assign the arguments to a variable
+    arguments = cli_parser.parse_args()
+
+    if vars(arguments)['debug']:
+        logging.basicConfig(level=logging.DEBUG)
+        _logger.debug("Debug Logging Enabled")
+
+    return arguments
+
+
+def route_order(route_key):
+    """
+    Return a sort key which puts routes in network order, as the router lists them.
+
+    :param route_key: Tuple of (prefix, mask).
+    :return:
+    """
+    return struct.unpack("!II", socket.inet_aton(route_key[0]) + socket.inet_aton(route_key[1]))
+
+
+def route_fields(fields):
+    """
+    Parse a RESTCONF fields parameter, such as prefix;mask;fwd-list(fwd;name;tag), into a dictionary of each leaf
+    asked for, mapped to a dictionary of its own fields, or None for the whole leaf.
+
+    :param fields:
+    :return:
+    """
+    selected = {}
+
+    for name, inner in re.findall(r'([^;()]+)(?:\(([^)]*)\))?', fields):
+        selected[name.strip()] = route_fields(inner) if inner else None
+
+    return selected
+
+
+def route_project(item, fields):
+    """
+    Return only the fields of an item which were asked for.
+
+    :param item:
+    :param fields: As from route_fields, or None for the whole item.
+    :return:
+    """
+    if fields is None:
+        return item
+
+    if isinstance(item, list):
+        return [route_project(element, fields) for element in item]
+
+    return {name: route_project(item[name], inner) for name, inner in fields.items() if name in item}
+
+
+class RouterSimulator:
+    """
+    The static routes and FIB of a simulated IOS-XE router, along with the delays and failures it is to show.
+
+    Writes are applied to the configuration at once, while the FIB moves towards the number of configured routes at
+    the configured rate, so a large replacement can be watched draining through fib-oper-data the way it does on a
+    router.
+    """
+
+    def __init__(self, latency=0.0, route_latency=0.0, timeout=0.0, error_rate=0.0, chunk_error_rate=0.0,
+                 fib_rate=0.0, seed=None):
+        """
+        :param latency: Seconds added to every request.
+        :param route_latency: Seconds added for each route written or removed.
+        :param timeout: Writes taking longer than this many seconds are applied, then answered with a 504.
+        :param error_rate: Fraction of writes refused with a 503.
+        :param chunk_error_rate: Fraction of route retrievals cut off part way through.
+        :param fib_rate: Prefixes per second the FIB converges at, or 0 for at once.
+        :param seed: Random seed for injected errors.
+        """
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.route_latency = route_latency
+        self.timeout = timeout
+        self.error_rate = error_rate
+        self.chunk_error_rate = chunk_error_rate
+        self.fib_rate = fib_rate
+        self.random = random.Random(seed)
+
+        self.routes = {}
+        self.container = {}
+        self.ordered = None
+
+        self.fib = 0.0
+        self.fib_time = time.monotonic()
+
+        self.stats = {'requests': 0, 'written': 0, 'removed': 0, 'timeouts': 0, 'errors': 0, 'cutoffs': 0,
+                      'saves': 0}
+
+    def add_base(self, count, basename):
+        """
+        Add base routes to the simulator, such as the ones the routerunner leaves alone on a router.
+
+        :param count:
+        :param basename: Route name of the base routes.
+        :return:
+        """
+        for i in range(count):
+            self.merge([{'prefix': "192.0.{}.{}".format(i // 256 % 256, i % 256), 'mask': "255.255.255.255",
+                         'fwd-list': [{'fwd': "Null0", 'name': "{}-{}".format(basename, i)}]}])
+
+        self.fib_sync()
+
+    def fib_sync(self):
+        """
+        Bring the FIB into line with the configuration at once.
+
+        :return:
+        """
+        with self.lock:
+            self.fib = float(len(self.routes))
+            self.fib_time = time.monotonic()
+
+    def fib_size(self):
+        """
+        Return the number of prefixes in the FIB, having moved it towards the configuration for the time since it was
+        last looked at.
+
+        :return:
+        """
+        with self.lock:
+            now = time.monotonic()
+            target = float(len(self.routes))
+
+            if self.fib_rate <= 0:
+                self.fib = target
+            elif self.fib < target:
+                self.fib = min(target, self.fib + self.fib_rate * (now - self.fib_time))
+            else:
+                self.fib = max(target, self.fib - self.fib_rate * (now - self.fib_time))
+
+            self.fib_time = now
+
+            return int(self.fib)
+
+    def merge(self, entries):
+        """
+        Merge route entries into the configuration, as a PATCH does.  A route's forwarding entries are merged by their
+        forwarding address.
+
+        :param entries: List of ip-route-interface-forwarding-list entries.
+        :return: Number of routes written.
+        """
+        self.fib_size()
+
+        with self.lock:
+            for route_entry in entries:
+                route_key = (route_entry['prefix'], route_entry['mask'])
+                current = self.routes.get(route_key)
+
+                if current is None:
+                    self.routes[route_key] = route_entry
+                    self.ordered = None
+                    continue
+
+                fwd_list = {fwd['fwd']: fwd for fwd in current.get('fwd-list', [])}
+                for fwd in route_entry.get('fwd-list', []):
+                    fwd_list[fwd['fwd']] = {**fwd_list.get(fwd['fwd'], {}), **fwd}
+                self.routes[route_key] = {**current, **route_entry, 'fwd-list': list(fwd_list.values())}
+
+            self.stats['written'] += len(entries)
+
+        return len(entries)
+
+    def replace(self, container):
+        """
+        Replace the route container, as a PUT does.
+
+        :param container: Contents of the Cisco-IOS-XE-native:route container.
+        :return: Number of routes written and removed.
+        """
+        self.fib_size()
+
+        entries = container.get('ip-route-interface-forwarding-list', [])
+
+        with self.lock:
+            removed = len(self.routes)
+            self.routes = {}
+            self.container = {key: value for key, value in container.items()
+                              if key != 'ip-route-interface-forwarding-list'}
+            self.ordered = None
+            self.stats['removed'] += removed
+
+        return removed + self.merge(entries)
+
+    def remove(self, route_key):
+        """
+        Remove a route, as a DELETE does.
+
+        :param route_key: Tuple of (prefix, mask).
+        :return: True if the route was there.
+        """
+        self.fib_size()
+
+        with self.lock:
+            if self.routes.pop(route_key, None) is None:
+                return False
+
+            self.ordered = None
+            self.stats['removed'] += 1
+
+        return True
+
+    def route_list(self):
+        """
+        Return the configured routes in network order.
+
+        :return:
+        """
+        with self.lock:
+            if self.ordered is None:
+                self.ordered = [self.routes[route_key] for route_key in sorted(self.routes, key=route_order)]
+            return self.ordered
+
+    def fail(self):
+        """
+        Decide whether to refuse a write.
+
+        :return:
+        """
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def cut_off(self):
+        """
+        Decide whether to cut off a route retrieval.
+
+        :return:
+        """
+        with self.lock:
+            return self.random.random() < self.chunk_error_rate
+
+
+class SimulatorHandler(http.server.BaseHTTPRequestHandler):
+    """
+    RESTCONF requests for a RouterSimulator, which is found on the server.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        logging.getLogger("rtbh-simulator-xe/SimulatorHandler").debug(format % args)
+
+    def send_json(self, status, body=None):
+        """
+        Send a complete response.
+
+        :param status:
+        :param body: Response body to be encoded as JSON, or None for no body.
+        :return:
+        """
+        content = json.dumps(body).encode() if body is not None else b''
+
+        self.send_response(status)
+        if content:
+            self.send_header('Content-Type', 'application/yang-data+json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def send_chunked(self, head, items, tail, cut_off=False):
+        """
+        Send a response in chunks as a router does for a large table, optionally cutting it off part way through.
+
+        :param head: Bytes before the items.
+        :param items: List of items to be encoded as JSON.
+        :param tail: Bytes after the items.
+        :param cut_off: Drop the connection after about half of the items.
+        :return:
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/yang-data+json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        stop = len(items) // 2 if cut_off else None
+
+        def chunk(data):
+            self.wfile.write("{:x}\r\n".format(len(data)).encode() + data + b"\r\n")
+
+        chunk(head)
+        for start in range(0, len(items), 1000):
+            if stop is not None and start >= stop:
+                self.wfile.flush()
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            chunk((b", " if start else b"") + b", ".join(json.dumps(item).encode()
+                                                         for item in items[start:start + 1000]))
+        chunk(tail)
+        chunk(b"")
+
+    def read_body(self):
+        """
+        Read and decode the JSON body of a request.
+
+        :return:
+        """
+        length = int(self.headers.get('Content-Length') or 0)
+        if length == 0:
+            return {}
+
+        return json.loads(self.rfile.read(length))
+
+    def write_delay(self, simulator, routes):
+        """
+        Hold a write for as long as the simulated router takes over it.  A write which outlasts the timeout is held
+        only until the timeout.
+
+        :param simulator:
+        :param routes: Routes written or removed.
+        :return: True if the write timed out.
+        """
+        delay = simulator.latency + simulator.route_latency * routes
+
+        if simulator.timeout and delay > simulator.timeout:
+            time.sleep(simulator.timeout)
+            with simulator.lock:
+                simulator.stats['timeouts'] += 1
+            return True
+
+        time.sleep(delay)
+        return False
+
+    def do_GET(self):
+        simulator = self.server.simulator
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+
+        with simulator.lock:
+            simulator.stats['requests'] += 1
+
+        time.sleep(simulator.latency)
+
+        path = url.path.rstrip('/')
+
+        if path == ROUTE_PATH or path == ROUTE_LIST_PATH:
+            routes = simulator.route_list()
+
+            if not routes and not (path == ROUTE_PATH and simulator.container):
+                self.send_json(204)
+                return
+
+            if 'fields' in query:
+                routes = route_project(routes, route_fields(query['fields'][0]))
+
+            cut_off = simulator.cut_off()
+            if cut_off:
+                with simulator.lock:
+                    simulator.stats['cutoffs'] += 1
+
+            if path == ROUTE_PATH:
+                container = json.dumps({'Cisco-IOS-XE-native:route': simulator.container})[:-2].encode()
+                if simulator.container:
+                    container += b", "
+                self.send_chunked(container + b'"ip-route-interface-forwarding-list": [', routes, b"]}}", cut_off)
+            else:
+                self.send_chunked(b'{"Cisco-IOS-XE-native:ip-route-interface-forwarding-list": [', routes, b"]}",
+                                  cut_off)
+
+        elif path == FIB_PATH:
+            fib_size = simulator.fib_size()
+            self.send_json(200, {'Cisco-IOS-XE-fib-oper:fib-ni-entry': [
+                {'instance-name': "IPv4:Default", 'num-pfx': fib_size, 'num-pfx-fwd': fib_size}]})
+
+        elif path == "/restconf" or path.startswith("/restconf/data/ietf-restconf"):
+            self.send_json(200, {'ietf-restconf:restconf': {'data': {}, 'operations': {},
+                                                            'yang-library-version': "2016-06-21"}})
+
+        else:
+            self.send_json(404)
+
+    def do_PUT(self):
+        simulator = self.server.simulator
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        body = self.read_body()
+
+        with simulator.lock:
+            simulator.stats['requests'] += 1
+
+        if path != ROUTE_PATH:
+            self.send_json(405)
+            return
+
+        if simulator.fail():
+            with simulator.lock:
+                simulator.stats['errors'] += 1
+            time.sleep(simulator.latency)
+            self.send_json(503)
+            return
+
+        routes = simulator.replace(body.get('Cisco-IOS-XE-native:route', {}))
+        self.send_json(504 if self.write_delay(simulator, routes) else 204)
+
+    def do_PATCH(self):
+        simulator = self.server.simulator
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        body = self.read_body()
+
+        with simulator.lock:
+            simulator.stats['requests'] += 1
+
+        if path != ROUTE_PATH:
+            self.send_json(405)
+            return
+
+        if simulator.fail():
+            with simulator.lock:
+                simulator.stats['errors'] += 1
+            time.sleep(simulator.latency)
+            self.send_json(503)
+            return
+
+        if self.headers.get('Content-Type', "").startswith('application/yang-patch+json'):
+            self.yang_patch(simulator, body.get('ietf-yang-patch:yang-patch', {}))
+            return
+
+        routes = simulator.merge(body.get('Cisco-IOS-XE-native:route', {}).get('ip-route-interface-forwarding-list',
+                                                                               []))
+        self.send_json(504 if self.write_delay(simulator, routes) else 204)
+
+    def yang_patch(self, simulator, patch):
+        """
+        Apply a YANG Patch to the route container.  Only remove edits of routes are taken, and any other edit rejects
+        the whole patch.
+
+        :param simulator:
+        :param patch: Contents of the ietf-yang-patch:yang-patch container.
+        :return:
+        """
+        edits = patch.get('edit', [])
+        prefix = "/ip-route-interface-forwarding-list="
+
+        if any(edit.get('operation') != 'remove' or not edit.get('target', "").startswith(prefix) for edit in edits):
+            time.sleep(simulator.latency)
+            self.send_json(400)
+            return
+
+        removed = 0
+        for edit in edits:
+            route_prefix, _, mask = urllib.parse.unquote(edit['target'][len(prefix):]).partition(',')
+            if simulator.remove((route_prefix, mask)):
+                removed += 1
+
+        if self.write_delay(simulator, removed):
+            self.send_json(504)
+            return
+
+        self.send_json(200, {'ietf-yang-patch:yang-patch-status': {'patch-id': patch.get('patch-id'), 'ok': [None]}})
+
+    def do_DELETE(self):
+        simulator = self.server.simulator
+        path = urllib.parse.unquote(urllib.parse.urlsplit(self.path).path)
+
+        with simulator.lock:
+            simulator.stats['requests'] += 1
+
+        if not path.startswith(ROUTE_LIST_PATH + "="):
+            self.send_json(405)
+            return
+
+        if simulator.fail():
+            with simulator.lock:
+                simulator.stats['errors'] += 1
+            time.sleep(simulator.latency)
+            self.send_json(503)
+            return
+
+        prefix, _, mask = path[len(ROUTE_LIST_PATH) + 1:].partition(',')
+        if not simulator.remove((prefix, mask)):
+            time.sleep(simulator.latency)
+            self.send_json(404)
+            return
+
+        self.send_json(504 if self.write_delay(simulator, 1) else 204)
+
+    def do_POST(self):
+        simulator = self.server.simulator
+        path = urllib.parse.urlsplit(self.path).path.rstrip('/')
+        self.read_body()
+
+        with simulator.lock:
+            simulator.stats['requests'] += 1
+
+        time.sleep(simulator.latency)
+
+        if path != SAVE_PATH:
+            self.send_json(404)
+            return
+
+        with simulator.lock:
+            simulator.stats['saves'] += 1
+
+        self.send_json(200, {'cisco-ia:output': {'result': "Save running-config successful"}})
+
+
+def simulator_server(simulator, host='127.0.0.1', port=0, cert=None, key=None):
+    """
+    Open a server for a simulated router.  Each connection is served on its own thread.
+
+    :param simulator: RouterSimulator
+    :param host:
+    :param port: Port to listen on, or 0 for any free port.
+    :param cert: Certificate file, to serve HTTPS.
+    :param key: Private key file for the certificate.
+    :return: ThreadingHTTPServer, ready for serve_forever.
+    """
+    server = http.server.ThreadingHTTPServer((host, port), SimulatorHandler)
+    server.daemon_threads = True
+    server.simulator = simulator
+
+    if cert is not None:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+
+    return server
+
+
+if __name__ == "__main__":
+
+    logger = logging.getLogger("rtbh-simulator-xe")
+
+    # Process CLI Arguments
+    args = cli_args()
+
+    simulator = RouterSimulator(latency=vars(args)['latency'],
+                                route_latency=vars(args)['route_latency'],
+                                timeout=vars(args)['timeout'],
+                                error_rate=vars(args)['error_rate'],
+                                chunk_error_rate=vars(args)['chunk_error_rate'],
+                                fib_rate=vars(args)['fib_rate'],
+                                seed=vars(args)['seed'])
+    simulator.add_base(vars(args)['base'], vars(args)['basename'])
+
+    server = simulator_server(simulator, vars(args)['host'], vars(args)['port'], vars(args)['cert'],
+                              vars(args)['key'])
+
+    print("RTBH IOS-XE Simulator")
+    print("=====================")
+    print("Listening on {}://{}:{}".format("https" if vars(args)['cert'] else "http", vars(args)['host'],
+                                           server.server_address[1]))
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    print()
+    print("Simulator Summary")
+    print("------------")
+    for name, count in simulator.stats.items():
+        print("{:.<11}: {}".format(name.capitalize(), count))
+    print("------------")
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+# Internal Imports
+import logging
+import re
+import threading
+import time
+
+# External Imports
+import psycopg2.extensions
+import psycopg2.extras
+
+
+class StatementStats:
+    """
+    Running totals of the statements executed through this module, so statement rates can be compared between runs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        self.elapsed = 0.0
+
+    def record(self, count, elapsed):
+        with self.lock:
+            self.count += count
+            self.elapsed += elapsed
+
+    def rate(self):
+        """
+        Return the number of statements executed per second of database time.
+        """
+        with self.lock:
+            if self.elapsed == 0:
+                return 0.0
+            return self.count / self.elapsed
+
+
+statement_stats = StatementStats()
+
+
+class StatementConnection(psycopg2.extensions.connection):
+    """
+    A database connection which remembers the statements prepared on it.
+
+    Pass this as the connection_factory to psycopg2.connect().  Setting prepare to False runs the same statements as
+    plain parameterized queries instead, which is useful for comparing the two.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepare = True
+        self.prepared = set()
+        self.statements = {}
+
+
+def statement_sql(db_link, name, sql):
+    """
+    Return the SQL used to run a named statement on a connection, along with its parameter order.
+
+    Statements are written with $1, $2, ... placeholders.  A prepared statement is run with EXECUTE, otherwise the
+    placeholders are swapped for bound parameters.
+
+    :param db_link:
+    :param name:
+    :param sql:
+    :return: Tuple of (SQL, parameter order).
+    """
+    statements = getattr(db_link, 'statements', None)
+    use_prepared = getattr(db_link, 'prepare', False)
+
+    if statements is not None and (name, use_prepared) in statements:
+        return statements[(name, use_prepared)]
+
+    order = [int(index) - 1 for index in re.findall(r'\$(\d+)', sql)]
+
+    if use_prepared:
+        count = max(order) + 1 if order else 0
+        result = ("EXECUTE {} ({})".format(name, ", ".join(["%s"] * count)) if count else "EXECUTE {}".format(name),
+                  list(range(count)))
+    else:
+        result = (re.sub(r'\$\d+', '%s', sql.replace('%', '%%')), order)
+
+    if statements is not None:
+        statements[(name, use_prepared)] = result
+
+    return result
+
+
+def statement_prepare(db, name, sql):
+    """
+    Prepare a named statement on the cursor's connection, if it hasn't been already.
+
+    :param db: Cursor
+    :param name:
+    :param sql:
+    :return:
+    """
+    log = logging.getLogger("statements/statement_prepare")
+
+    db_link = db.connection
+
+    if not getattr(db_link, 'prepare', False) or name in db_link.prepared:
+        return
+
+    db.execute("PREPARE {} AS {}".format(name, sql))
+    db_link.prepared.add(name)
+
+    log.debug("Prepared statement {}.".format(name))
+
+
+def execute_prepared(db, name, sql, params=()):
+    """
+    Execute a named statement with bound parameters, preparing it on the connection the first time it is used.
+
+    :param db: Cursor
+    :param name: Statement name, unique per statement text.
+    :param sql: Statement text using $1, $2, ... placeholders.
+    :param params: Parameter values.
+    :return:
+    """
+    statement_prepare(db, name, sql)
+    query, order = statement_sql(db.connection, name, sql)
+
+    started = time.perf_counter()
+    db.execute(query, [params[i] for i in order])
+    statement_stats.record(1, time.perf_counter() - started)
+
+
+def execute_prepared_batch(db, name, sql, param_list, page_size=500):
+    """
+    Execute a named statement once for each set of parameters, sending them to the server in pages.
+
+    :param db: Cursor
+    :param name: Statement name, unique per statement text.
+    :param sql: Statement text using $1, $2, ... placeholders.
+    :param param_list: List of parameter value tuples.
+    :param page_size: Number of statements sent per round trip.
+    :return:
+    """
+    if len(param_list) == 0:
+        return
+
+    statement_prepare(db, name, sql)
+    query, order = statement_sql(db.connection, name, sql)
+
+    started = time.perf_counter()
+    psycopg2.extras.execute_batch(db, query, [[params[i] for i in order] for params in param_list],
+                                  page_size=page_size)
+    statement_stats.record(len(param_list), time.perf_counter() - started)